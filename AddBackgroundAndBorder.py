@@ -1,6 +1,65 @@
 import numpy as np
-import os
-import matplotlib.pyplot as plt
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from FloodFill import edge_seeds, neighbours_any, reachable_region, seeds_to_mask
+from TileStore import load_tile
+from PatternMatrix import asPatternMatrix
+
+
+def tile_values(tile, rows, cols, shift=0):
+    """
+    Use: values = tile_values(tile, rows, cols, shift)
+    Pre: tile is a 2D numpy array, rows and cols are integer arrays of row and column indexes
+         of cells in a canvas that tile is repeated over.
+    Post: values are the values of the repeated tile at the cells, with the tile shifted up by shift rows,
+          i.e. values = tile[(rows+shift)%n, cols%m] where n,m is the shape of tile.
+          Only the tile and the values are in memory, the repeated canvas is never made.
+    """
+    n, m = tile.shape
+    return tile[(rows + shift) % n, cols % m]
+
+
+
+def tile_to_shape(tile, shape, shift=0):
+    """
+    Use: repeated = tile_to_shape(tile, shape, shift)
+    Post: repeated is a matrix of the given shape where tile has been repeated
+          (from the top left corner) with the tile shifted up by shift rows.
+    """
+    rows, cols = shape
+    return tile_values(tile, np.arange(rows)[:, None], np.arange(cols)[None, :], shift)
+
+
+
+def fill_tiled(matrix, tile, region, shift=0):
+    """
+    Use: fill_tiled(matrix, tile, region, shift)
+    Pre: matrix is a pattern matrix, tile is a 2D numpy array and region is a boolean mask of the shape of matrix.
+    Post: the cells of region in matrix have been set to the values of tile repeated over matrix from the top
+          left corner, with the tile shifted up by shift rows, i.e. to tile_to_shape(tile, matrix.shape, shift)[region].
+          Each row of the tile is written into every n-th row of matrix (n the rows of tile) at once, so only
+          the tile widened to the columns of matrix and n-th of matrix are in memory at a time.
+    """
+    n, m = tile.shape
+    rows, cols = matrix.shape
+    tile = tile[:, np.arange(cols) % m].astype(matrix.dtype)
+    for i in range(n):
+        tile_rows = slice((i - shift) % n, rows, n)
+        matrix[tile_rows] = np.where(region[tile_rows], tile[i], matrix[tile_rows])
+
+
+
+def _border_tile(border_file_path, border_dark_shade=2, border_background_shade=1):
+    """
+    Returns the border tile of add_border as uint8 with the shades, 1 is border_dark_shade and 0 border_background_shade.
+    """
+    tile = load_tile(border_file_path)
+    tile[tile==1] = border_dark_shade
+    tile[tile==0] = border_background_shade
+    if tile.size and (tile.min() < 0 or tile.max() > 255):
+        raise ValueError("A pattern matrix can only contain integers 0-255.")
+    return tile.astype(np.uint8)
+
 
 
 def add_border(matrix, border_file_path="empty", side=[0,0,0,0], size=[0,0,0,0],border_dark_shade = 2,border_background_shade = 1):
@@ -8,7 +67,7 @@ def add_border(matrix, border_file_path="empty", side=[0,0,0,0], size=[0,0,0,0],
     Use: example:     matrix_with_border = add_border(matrix, "~/path/to/border/file" ,side=[1,1,0,0])
          or:    matrix_with_empty_border = add_border(matrix, side=[1,1,1,1], size=[3,3,2,2]) 
     Pre:  matrix is a binary pattern matrix from Sjonabok. border_file_path is the absolut path to the border txt file
-          to add as border to matrix. If border_file_path="empty" an empty border(consisting of zeros) will be added to
+          to add as border to matrix (or a tile id from an opened TileStore or the border tile as a numpy array). If border_file_path="empty" an empty border(consisting of zeros) will be added to
           the appropriate sides of matrix.
           side is a list of length 4 and represents in order [top,bottom,left,right] the sides to which to add the border.
           if 0 then no border is added to said side, if 1 the border is added to the side.
@@ -18,21 +77,21 @@ def add_border(matrix, border_file_path="empty", side=[0,0,0,0], size=[0,0,0,0],
           matrix_with_empty_border has added an empty boarder(consisting of ones) to all sides of matrix with
           where on the top and bottom the border has length 3 and on the sides the border has size 2.
     """
-    if border_file_path=="empty":
+    if np.asarray(matrix).dtype != np.uint8:
+        matrix = asPatternMatrix(matrix) #uint8, so the borders are stacked without converting the matrix
+    if isinstance(border_file_path, str) and border_file_path=="empty":
         if side[0]:
-            matrix = np.vstack((np.ones((size[0],matrix.shape[1])),matrix))
+            matrix = np.vstack((np.ones((size[0],matrix.shape[1]), dtype=np.uint8),matrix))
         if side[1]:
-            matrix = np.vstack((matrix,np.ones((size[1],matrix.shape[1]))))
+            matrix = np.vstack((matrix,np.ones((size[1],matrix.shape[1]), dtype=np.uint8)))
         if side[2]:
-            matrix = np.hstack((np.ones((matrix.shape[0],size[2])),matrix))
+            matrix = np.hstack((np.ones((matrix.shape[0],size[2]), dtype=np.uint8),matrix))
         if side[3]:
-            matrix = np.hstack((matrix,np.ones((matrix.shape[0],size[3]))))
-        return matrix
+            matrix = np.hstack((matrix,np.ones((matrix.shape[0],size[3]), dtype=np.uint8)))
+        return asPatternMatrix(matrix)
     
     #load border
-    border_smallest_repeat = np.loadtxt(os.path.expanduser(border_file_path),dtype=int)
-    border_smallest_repeat[border_smallest_repeat==1] = border_dark_shade
-    border_smallest_repeat[border_smallest_repeat==0] = border_background_shade
+    border_smallest_repeat = _border_tile(border_file_path, border_dark_shade, border_background_shade)
 
     height,length = matrix.shape 
     n,m = border_smallest_repeat.shape
@@ -40,13 +99,8 @@ def add_border(matrix, border_file_path="empty", side=[0,0,0,0], size=[0,0,0,0],
 
     # horizontal border
     if side[0] or side[1]:
-        #find length
-        whole_multiples = length//m
-        border = np.hstack([border_smallest_repeat]*whole_multiples) 
-        remaining_border_lenght = length - border.shape[1]
-        if remaining_border_lenght > 0:
-            border = np.hstack((border,border[:,:remaining_border_lenght]))
-        
+        border = tile_to_shape(border_smallest_repeat, (n, length))
+
         #add border to matrix
         if side[0]: #top
             matrix = np.vstack((border,matrix))
@@ -58,13 +112,7 @@ def add_border(matrix, border_file_path="empty", side=[0,0,0,0], size=[0,0,0,0],
     
     #vertical border
     if side[2] or side[3]:
-        #find length
-        whole_multiples = height//m
-        border = np.vstack([border_smallest_repeat.T]*whole_multiples)
-        remaining_border_height = height - border.shape[0]
-
-        if remaining_border_height > 0:
-            border = np.vstack((border,border[:remaining_border_height,:]))
+        border = tile_to_shape(border_smallest_repeat.T, (height, n))
 
         #add vertical border to matrix
         if side[2]: #left
@@ -72,143 +120,118 @@ def add_border(matrix, border_file_path="empty", side=[0,0,0,0], size=[0,0,0,0],
         if side[3]: #right
             matrix = np.hstack((matrix,border))
 
-    return matrix
+    return asPatternMatrix(matrix)
 
 
 
 
 def find_first_not_background_from_center(matrix, background_color):
-    rows, cols = matrix.shape
+    """
+    Use: cell = find_first_not_background_from_center(matrix, background_color)
+    Post: cell is the index (i,j) of the stitch of matrix that is not background_color and is closest to the
+          center (rows//2, cols//2), measured with the euclidean distance over all stitches at once. Of stitches
+          that are equally close the first one in row-major order is chosen. cell is None if all stitches are background.
+    """
+    rows, cols = np.shape(matrix)
     center_row, center_col = rows // 2, cols // 2
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # Right, Down, Left, Up
-    step = 1 
-    x, y = center_row, center_col  # search from center
+    cells = np.argwhere(np.asarray(matrix) != background_color)
+    if len(cells) == 0:
+        return None  # Return None if no non background color found
+    distance = (cells[:, 0] - center_row)**2 + (cells[:, 1] - center_col)**2
+    x, y = cells[np.argmin(distance)]
+    return (int(x), int(y))
 
-    if matrix[x, y] != background_color:
-        return (x, y)
 
-    while step < max(rows, cols):
-        for direction in directions:
-            for _ in range(step):
-                x += direction[0]
-                y += direction[1]
-                if x < 0 or x >= rows or y < 0 or y >= cols:
-                    continue
-                if matrix[x, y] != background_color:
-                    return (x, y)
-        if direction == directions[1] or direction == directions[3]:  # Double the step size after Down and Up directions
-            step += 1
 
-    return None  # Return None if no non background color found
+def background_seeds(matrix, matrix_background_color=1):
+    """
+    Use: starts = background_seeds(matrix, matrix_background_color)
+    Post: starts is a list of the background stitches on the edge of matrix, a flood fill from them fills all
+          the background that is connected to the edge. This is what background_starts="auto" uses.
+    """
+    return edge_seeds(np.asarray(matrix) == matrix_background_color)
+
+
+
+def background_region(matrix, matrix_background_color, background_starts, filled=None):
+    """
+    Use: region, border_ring = background_region(matrix, matrix_background_color, background_starts, filled)
+    Pre: matrix is a pattern matrix, background_starts is a list of tuples (i,j) of matrix indexes,
+         filled is None or a boolean mask of cells that an earlier flood fill has already filled.
+    Post: region is a boolean mask of the cells that a flood fill of the background from background_starts
+          (and from the filled cells) visits, i.e. the starts and every cell of color matrix_background_color
+          connected to them.
+          border_ring is a boolean mask of the cells of region that touch the main feature of the image,
+          i.e. have a neighbour up, down, left or right that is neither background nor already filled.
+    The starts are filled first and in order, so a start only counts the starts after it as main feature.
+    """
+    matrix = np.asarray(matrix)
+    n, m = matrix.shape
+    to_visit = [tuple(int(i) for i in start) for start in background_starts]
+    non_border_colors = [matrix_background_color, 10, 11, 13]
+    if filled is None:
+        filled = np.zeros(matrix.shape, dtype=bool)
+
+    region = reachable_region(matrix == matrix_background_color, to_visit + list(zip(*np.nonzero(filled)))) & ~filled
+    starts = seeds_to_mask(matrix.shape, to_visit)
+    main_feature = ~np.isin(matrix, non_border_colors) & ~starts & ~filled
+    border_ring = region & neighbours_any(main_feature) & ~starts
+
+    #a start is filled last at its last occurrence, the starts before that are filled already
+    first_fill = {}
+    last_fill = {}
+    for order, start in enumerate(to_visit):
+        first_fill.setdefault(start, order)
+        last_fill[start] = order
+    for (x, y), order in last_fill.items():
+        for nx, ny in [(x-1, y), (x+1, y), (x, y-1), (x, y+1)]:
+            if 0 <= nx < n and 0 <= ny < m:
+                before = first_fill.get((nx, ny), order) < order or filled[nx, ny]
+                if matrix[nx, ny] not in non_border_colors and not before:
+                    border_ring[x, y] = True
+
+    return region, border_ring
 
 
 
 def add_background(matrix, background_file_path="empty", matrix_background_color=1, background_starts=[], border=True, border_color=1,background_color_0=1,background_color_1=4):
     """
     Adds a Sjonabok pattern as background to matrix where the pattern is provided as an absolute path to a txt file as background_file-path.
+    background_file_path can also be a tile id from an opened TileStore or the pattern as a numpy array.
     matrix_background_color is the background color of matrix. If border=True a border with color border_color is added around the main feature of the image,
     i.e. no background is added there.
     background_color_0 is the lighter shade of the sjonabok pattern and background_color_1 is the darker shade.
     The function goes through the backround of matrix with flood-fill from each corner of the matrix to find the main feature (i.e. not background).
     For custom starts of the flood-fill let background_starts be a list of tuples (i,j) of matrix indexes where the algorithm should start the flood-fill.
+    With background_starts="auto" the flood-fill starts from all background stitches on the edge of matrix (see background_seeds),
+    so background that the corners can not reach is filled without picking starts by hand.
     """
     n,m = matrix.shape
-    #make bakground matrix (same size as matrix)
-    background_smallest = np.loadtxt(os.path.expanduser(background_file_path),dtype=int)
+    #load background tile, it is repeated over matrix where it is needed
+    background_smallest = load_tile(background_file_path)
     background_smallest = background_smallest[:-1,:-1]
     background_smallest[background_smallest==1] = 11
     background_smallest[background_smallest==0] = 10
-    background_smallest_n,background_smallest_m = background_smallest.shape
-
-    #multiply vertical wise
-    whole_multiples = n//background_smallest_n
-    background = np.vstack([background_smallest]*whole_multiples)
-    remaining_background_height = n - background.shape[0]
-    if remaining_background_height > 0:
-        background = np.vstack((background,background[:remaining_background_height,:]))
-
-    #multiply horizontal wise
-    #
-    #breakpoint()
-    whole_multiples = m//background_smallest_m
-    background = np.hstack([background]*whole_multiples) 
-    remaining_background_lenght = m - background.shape[1]
-    if remaining_background_lenght > 0:
-            background = np.hstack((background,background[:,:remaining_background_lenght]))
-    
-  
-    #flood fill background of matrix with matrix, starting in top left corner
-    if background_starts:
+
+    #flood fill background of matrix with matrix, starting in the corners
+    if isinstance(background_starts, str) and background_starts == "auto":
+        to_visit = background_seeds(matrix, matrix_background_color)
+    elif background_starts:
         to_visit = background_starts
     else:
         to_visit = [(0,0),(n-1,0),(0,m-1),(n-1,m-1)]
-    
-    border_encountered = 0 #border of main image
-    non_border_colors = [matrix_background_color,10,11,13]
-    while to_visit:
-        current = to_visit[0] #cross we are searching from
-        to_visit = to_visit[1:]
-    #searching up
-        if (current[0]-1) >= 0: #assuring we are not going out of matrix range
-            searching_idx = (current[0]-1,current[1])
-            if matrix[searching_idx]==matrix_background_color and searching_idx not in to_visit:
-                to_visit.append(searching_idx)
-            if matrix[searching_idx] not in non_border_colors:
-                border_encountered = 1
-            
-        #searching down
-        if (current[0]+1) < n:
-            searching_idx = (current[0]+1,current[1])
-            if matrix[searching_idx]==matrix_background_color and searching_idx not in to_visit:
-                to_visit.append(searching_idx)
-            if matrix[searching_idx] not in non_border_colors:
-                border_encountered = 1
-
-        #searching left
-        if (current[1]+1) < m:
-            searching_idx=(current[0],current[1]+1)
-            if matrix[searching_idx]==matrix_background_color and searching_idx not in to_visit:
-                to_visit.append(searching_idx)
-            if matrix[searching_idx] not in non_border_colors:
-                border_encountered = 1
-            
-        #searching right
-        if current[1] - 1 >= 0:
-            searching_idx=(current[0],current[1]-1)
-            if matrix[searching_idx]==matrix_background_color and searching_idx not in to_visit:
-                to_visit.append(searching_idx)
-            if matrix[searching_idx] not in non_border_colors:
-                border_encountered = 1
-        """
-        #search for background_color diagonally 1 from current    
-        top_left_idx =     (current[0]-1,current[1]-1)
-        bottom_left_idx =  (current[0]+1,current[1]-1)
-        top_right_idx =    (current[0]-1,current[1]+1)
-        bottom_right_idx = (current[0]+1,current[1]+1)
-        if top_left_idx[0] >= 0 and top_left_idx[1] >= 0 and matrix[top_left_idx]==matrix_background_color and top_left_idx not in to_visit:
-                to_visit.append(top_left_idx)
-            
-        if bottom_left_idx[0] < n and bottom_left_idx[1] >= 0 and matrix[bottom_left_idx]==matrix_background_color and bottom_left_idx not in to_visit:
-                to_visit.append(bottom_left_idx)
-            
-        if top_right_idx[0] >= 0 and top_right_idx[1] < m and matrix[top_right_idx]==matrix_background_color and top_right_idx not in to_visit:
-                to_visit.append(top_right_idx)
 
-        if bottom_right_idx[0] < n and bottom_right_idx[1] < m and matrix[bottom_right_idx]==matrix_background_color and bottom_right_idx not in to_visit:
-                to_visit.append(bottom_right_idx)
-        """
-        if border and border_encountered:
-            matrix[current] = 13
-        else:
-            matrix[current] = background[current]
-        border_encountered = 0
+    region, border_ring = background_region(matrix, matrix_background_color, to_visit)
+    fill_tiled(matrix, background_smallest, region)
+    if border:
+        matrix[region & border_ring] = 13
 
     matrix[matrix==11] = background_color_1
     matrix[matrix==10] = background_color_0
     if border:
         matrix[matrix==13] = border_color
 
-    return matrix
+    return asPatternMatrix(matrix)
 
             
 
@@ -217,66 +240,32 @@ def add_background_seamless(matrix, background_file_path="empty", matrix_backgro
                    border=True, border_color=1, background_color_0=1, background_color_1=4, 
                    shift_background=None):
     """
+    Works the same as add_background.
     shift_background shifts background from top to bottom
+    background_starts=None starts the flood fill in the corners and background_starts="auto" from all
+    background stitches on the edge.
     """
     n, m = matrix.shape
     
     # Load and process the background
-    background_smallest = np.loadtxt(os.path.expanduser(background_file_path), dtype=int)
+    background_smallest = load_tile(background_file_path)
     background_smallest = background_smallest[:-1, :-1]
     background_smallest[background_smallest == 1] = 11
     background_smallest[background_smallest == 0] = 10
-    background_smallest_n, background_smallest_m = background_smallest.shape
-
-    if shift_background:
-        background_smallest = np.roll(background_smallest, shift=-shift_background, axis=0)
-   
-    # Create background
-    #multiply vertical wise
-    whole_multiples = n//background_smallest_n
-    background = np.vstack([background_smallest]*whole_multiples)
-    remaining_background_height = n - background.shape[0]
-    if remaining_background_height > 0:
-        background = np.vstack((background,background[:remaining_background_height,:]))
-
-    #multiply horizontal wise
-
-    whole_multiples = m//background_smallest_m
-    background = np.hstack([background]*whole_multiples) 
-    remaining_background_lenght = m - background.shape[1]
-    if remaining_background_lenght > 0:
-            background = np.hstack((background,background[:,:remaining_background_lenght]))
-    background = background[:n, :m]
-
-    # Shift the background to start at the custom start point
-    #breakpoint()
-    #background = np.roll(background, shift=(start_y, start_x), axis=(0, 1))
-
-    # Initialize the BFS search from the corners or provided start points
+
+    # Flood fill from the corners or provided start points
     if background_starts is None:
         to_visit = [(0, 0), (n-1, 0), (0, m-1), (n-1, m-1)]
+    elif isinstance(background_starts, str) and background_starts == "auto":
+        to_visit = background_seeds(matrix, matrix_background_color)
     else:
         to_visit = background_starts
 
-    non_border_colors = {matrix_background_color, 10, 11, 13}
-
-    while to_visit:
-        x, y = to_visit.pop(0)
-        neighbors = [(x-1, y), (x+1, y), (x, y-1), (x, y+1)]  # Up, Down, Left, Right
-
-        border_encountered = False
-
-        for nx, ny in neighbors:
-            if 0 <= nx < n and 0 <= ny < m:
-                if matrix[nx, ny] == matrix_background_color and (nx, ny) not in to_visit:
-                    to_visit.append((nx, ny))
-                if matrix[nx, ny] not in non_border_colors:
-                    border_encountered = True
-
-        if border and border_encountered:
-            matrix[x, y] = 13
-        else:
-            matrix[x, y] = background[x, y]
+    region, border_ring = background_region(matrix, matrix_background_color, to_visit)
+    # the background is shifted by looking up the tile rows shift_background further down
+    fill_tiled(matrix, background_smallest, region, shift=shift_background or 0)
+    if border:
+        matrix[region & border_ring] = 13
 
     # Replace temporary colors with final background colors
     matrix[matrix == 11] = background_color_1
@@ -284,7 +273,216 @@ def add_background_seamless(matrix, background_file_path="empty", matrix_backgro
     if border:
         matrix[matrix == 13] = border_color
 
-    return matrix
+    return asPatternMatrix(matrix)
+
+
+
+def _border_layer(arguments):
+    """
+    Returns the tile of an add_border layer with its shades (None for an empty border) and the
+    number of rows or columns it adds to [top,bottom,left,right].
+    """
+    side = arguments.get("side", [0,0,0,0])
+    border_file_path = arguments.get("border_file_path", "empty")
+    if isinstance(border_file_path, str) and border_file_path=="empty":
+        size = arguments.get("size", [0,0,0,0])
+        return None, [size[i] if side[i] else 0 for i in range(4)]
+
+    tile = _border_tile(border_file_path, arguments.get("border_dark_shade", 2), arguments.get("border_background_shade", 1))
+    return tile, [tile.shape[0] if side[i] else 0 for i in range(4)]
+
+
+
+def compose_layers(matrix, layers):
+    """
+    Use: example:   pattern = compose_layers(matrix, [{"add_border": {"side":[1,1,1,1], "size":[3,3,2,2]}},
+                                                      {"add_border": {"border_file_path":"~/path/to/border/file", "side":[1,1,0,0]}},
+                                                      {"add_background": {"background_file_path":"~/path/to/background/file"}}])
+    Pre:  matrix is a pattern matrix, the motif. layers is a list of layers from the motif outwards, each layer
+          is an object with one of the keys "add_border", "add_background" or "add_background_seamless" and the
+          keyword arguments of that function (except matrix) as value, as the steps of a mynsturgerd config.
+    Post: pattern is the PatternMatrix that calling the functions of the layers in order on matrix gives.
+          The size of the finished canvas is computed from the layers first and the canvas is allocated
+          once as uint8, then the motif and each border is written into its slice of it and each
+          background is filled in place in the part of the canvas that it covers, so no layer
+          copies the matrix. matrix is not changed.
+    """
+    placed = []
+    height, length = np.shape(matrix)
+    top, left = 0, 0
+    for layer in layers:
+        (name, arguments), = layer.items()
+        if name == "add_border":
+            tile, size = _border_layer(arguments)
+            placed.append((name, tile, size))
+            height, length = height + size[0] + size[1], length + size[2] + size[3]
+            top, left = top + size[0], left + size[2]
+        elif name in ("add_background", "add_background_seamless"):
+            placed.append((name, None, arguments))
+        else:
+            raise ValueError(f"layer is {name}. A layer must be add_border, add_background or add_background_seamless.")
+
+    canvas = np.empty((height, length), dtype=np.uint8)
+    height, length = np.shape(matrix)
+    canvas[top:top+height, left:left+length] = np.asarray(asPatternMatrix(matrix))
+    for name, tile, arguments in placed:
+        if name == "add_border":
+            size = arguments
+            # horizontal border, as wide as the canvas inside it
+            for rows, shape in ((slice(top - size[0], top), (size[0], length)),
+                                (slice(top + height, top + height + size[1]), (size[1], length))):
+                canvas[rows, left:left+length] = 1 if tile is None else tile_to_shape(tile, shape)
+            top, height = top - size[0], height + size[0] + size[1]
+            # vertical border, as high as the canvas with the horizontal border
+            for cols, shape in ((slice(left - size[2], left), (height, size[2])),
+                                (slice(left + length, left + length + size[3]), (height, size[3]))):
+                canvas[top:top+height, cols] = 1 if tile is None else tile_to_shape(tile.T, shape)
+            left, length = left - size[2], length + size[2] + size[3]
+        elif name == "add_background":
+            add_background(canvas[top:top+height, left:left+length], **arguments)
+        else:
+            add_background_seamless(canvas[top:top+height, left:left+length], **arguments)
+
+    return asPatternMatrix(canvas)
+
+
+
+class BackgroundLayout:
+    """
+    The background region and border ring of a matrix, found once and reused for any number of
+    background colors, border colors, tiles and shifts.
+
+    Use: layout = BackgroundLayout(matrix, matrix_background_color, background_starts)
+         variant = layout.render(background_file_path, border, border_color, background_color_0, background_color_1, shift_background)
+
+    The flood fill is done when the layout is made, a render is one lookup of the tile over the
+    canvas and one np.where, and neither changes the matrix the layout was made from.
+    background_starts is as in add_background_seamless, None means the corners and "auto" the edge.
+    """
+
+    def __init__(self, matrix, matrix_background_color=1, background_starts=None):
+        self.matrix = np.array(matrix)
+        self.matrix.flags.writeable = False
+        n, m = self.matrix.shape
+        if background_starts is None:
+            background_starts = [(0, 0), (n-1, 0), (0, m-1), (n-1, m-1)]
+        elif isinstance(background_starts, str) and background_starts == "auto":
+            background_starts = background_seeds(self.matrix, matrix_background_color)
+        self.region, self.border_ring = background_region(self.matrix, matrix_background_color, background_starts)
+
+    def render(self, background_file_path="empty", border=True, border_color=1, background_color_0=1, background_color_1=4, shift_background=None):
+        """
+        Use: variant = layout.render(background_file_path, border, border_color, background_color_0, background_color_1, shift_background)
+        Post: variant is the PatternMatrix that add_background_seamless(matrix, background_file_path,
+              matrix_background_color, background_starts, border, border_color, background_color_0,
+              background_color_1, shift_background) gives for the matrix of the layout.
+        """
+        background_smallest = load_tile(background_file_path)[:-1, :-1]
+        background_smallest = np.where(background_smallest == 1, background_color_1,
+                                       np.where(background_smallest == 0, background_color_0, background_smallest))
+        background = tile_to_shape(background_smallest, self.matrix.shape, shift_background or 0)
+        if border:
+            background = np.where(self.border_ring, border_color, background)
+        return asPatternMatrix(np.where(self.region, background, self.matrix))
+
+
+
+def iter_add_background(bands, background_file_path="empty", matrix_background_color=1, background_starts=None,
+                        border=True, border_color=1, background_color_0=1, background_color_1=4,
+                        shift_background=None):
+    """
+    Use: for band in iter_add_background(bands, background_file_path, ...): ...
+    Pre: bands is an iterable of pattern matrices with the same number of columns, the row bands of a long
+         pattern from top to bottom (e.g. from iterImageToMatrix). The other arguments are as in
+         add_background_seamless, background_starts are indexes in the whole pattern or "auto", then each band
+         starts from the background stitches on its left and right edge (and the top of the first band and the
+         bottom of the last one).
+    Post: the bands are generated with the background added, without changing the bands that were given.
+          Only three bands are in memory at a time, the fill is carried from a band to the next one by the
+          filled cells of its last row (the frontier) and each band looks one row into the next one, with
+          the starts of the next band that are in that row, for the border ring.
+          The fill only goes forward: background that can only be reached by going back up from a
+          later band is not filled, and the bottom corners (which are starts by default) only fill
+          background in the last band. If every part of the background is reached from above (or from
+          a start in its own band) the bands are the rows of add_background_seamless on the whole pattern.
+          Otherwise a warning is given when the last band has been generated, with the rows where filled
+          background of a band is right below background of the band above it that was not filled
+          (the pattern can still be the same, if the tile has the background color where it is missing).
+    """
+    background_smallest = load_tile(background_file_path)
+    background_smallest = background_smallest[:-1, :-1]
+    background_smallest[background_smallest == 1] = 11
+    background_smallest[background_smallest == 0] = 10
+
+    def edge_starts(band, offset, first, last):
+        edge = np.zeros(band.shape, dtype=bool)
+        edge[:, [0, -1]] = True
+        edge[0] |= first
+        edge[-1] |= last
+        return [(i + offset, j) for i, j in np.argwhere(edge & (band == matrix_background_color)).tolist()]
+
+    bands = (np.asarray(band) for band in bands if len(band))
+    band = next(bands, None)
+    following = next(bands, None)
+    offset = 0
+    frontier = None #last row of the band before and the cells of it that were filled
+    unfilled = [] #last rows of bands with background that is only reached from the band below
+    while band is not None:
+        after = next(bands, None) if following is not None else None
+        h, m = band.shape
+        if background_starts is None:
+            #the bottom corners are known when the band or the next one is the last band
+            if following is None:
+                last = offset + h - 1
+            elif after is None:
+                last = offset + h + len(following) - 1
+            else:
+                last = None
+            starts = [(0, 0), (0, m - 1)] if last is None else [(0, 0), (last, 0), (0, m - 1), (last, m - 1)]
+        elif isinstance(background_starts, str) and background_starts == "auto":
+            starts = edge_starts(band, offset, offset == 0, following is None)
+            if following is not None:
+                starts += edge_starts(following[:1], offset + h, False, after is None and len(following) == 1)
+        else:
+            starts = [tuple(int(i) for i in start) for start in background_starts]
+
+        #the band with the row above it and the row below it
+        top = offset - (frontier is not None)
+        rows = [band]
+        if frontier is not None:
+            rows.insert(0, frontier[0][None, :])
+        if following is not None:
+            rows.append(following[:1])
+        extended = np.vstack(rows)
+        filled = np.zeros(extended.shape, dtype=bool)
+        if frontier is not None:
+            filled[0] = frontier[1]
+        local_starts = [(i - top, j) for i, j in starts if 0 <= i - top < len(extended)]
+
+        region, border_ring = background_region(extended, matrix_background_color, local_starts, filled)
+        region, border_ring = region[offset - top:offset - top + h], border_ring[offset - top:offset - top + h]
+        if frontier is not None and np.any((frontier[0] == matrix_background_color) & ~frontier[1] & region[0]):
+            unfilled.append(offset - 1)
+
+        result = band.copy()
+        fill_tiled(result, background_smallest, region, shift=offset + (shift_background or 0))
+        if border:
+            result[region & border_ring] = 13
+
+        result[result == 11] = background_color_1
+        result[result == 10] = background_color_0
+        if border:
+            result[result == 13] = border_color
+        yield result
+
+        frontier = (band[-1], region[-1])
+        offset += h
+        band, following = following, after
+
+    if unfilled:
+        warnings.warn(f"The background at and above row {', '.join(map(str, unfilled))} can only be reached from below and "
+                      "is not filled there, so the pattern can differ from add_background_seamless on the whole pattern.")
+
 
 
 def get_background_cutoff_row_number(image_rows, background_rows, last_image_background_cutoff_row_number):
@@ -312,3 +510,55 @@ def get_background_shift(image_rows, background_rows, last_image_background_cuto
 
 
 
+
+
+
+def background_shifts(panel_rows, background_rows):
+    """
+    Use: shifts = background_shifts(panel_rows, background_rows)
+    Pre: panel_rows is a list of the number of rows of each panel, background_rows is the number of rows
+         of the background tile (after its last row is dropped, as add_background_seamless does).
+    Post: shifts[i] is the shift_background of panel i, the same as chaining
+              cutoff = 0
+              for rows in panel_rows:
+                  shift = get_background_shift(rows, background_rows, cutoff)
+                  cutoff = get_background_cutoff_row_number(rows, background_rows, cutoff)
+          but computed for all panels at once, the cutoff of panel i is the sum of the rows of panels
+          0 to i modulo background_rows.
+    """
+    cutoffs = np.cumsum(panel_rows, dtype=np.int64) % background_rows
+    return (background_rows - cutoffs).tolist()
+
+
+
+def _fill_panel(panel, background, shift, options):
+    return add_background_seamless(np.array(panel), background, shift_background=shift, **options)
+
+
+
+def assemble_panels(panels, background_file_path="empty", processes=None, concatenate=False, **options):
+    """
+    Use: filled = assemble_panels(panels, background_file_path, processes, concatenate, border_color=1, ...)
+    Pre: panels is a list of pattern matrices with the same number of columns, the panels of a garment,
+         background_file_path is as in add_background_seamless and options are the other keyword
+         arguments of add_background_seamless (except shift_background). processes is None or the
+         number of worker processes to fill the panels in, with None (or 1) they are filled in order
+         in this process.
+    Post: Every panel has been filled with the background by add_background_seamless, shifted with
+          background_shifts so that the background is continuous when each panel is put on top of the
+          one before it: the tile lines up with the bottom row of panels[0] and each panel continues it upwards.
+          The shifts only depend on the number of rows, so they are all computed first and the panels can be
+          filled in parallel. The panels given are not changed.
+          If concatenate is False filled is a list of the filled panels as PatternMatrix, if it is True
+          filled is one PatternMatrix of them stacked with panels[0] at the bottom and panels[-1] at the top.
+    """
+    background = load_tile(background_file_path)
+    shifts = background_shifts([np.shape(panel)[0] for panel in panels], background.shape[0] - 1)
+    if not processes or processes == 1 or len(panels) <= 1:
+        filled = [_fill_panel(panel, background, shift, options) for panel, shift in zip(panels, shifts)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            filled = list(executor.map(_fill_panel, panels, [background]*len(panels), shifts, [options]*len(panels)))
+    if concatenate:
+        return asPatternMatrix(np.vstack(filled[::-1]))
+    return filled
@@ -0,0 +1,123 @@
+import numpy as np
+
+
+
+def neighbours_any(mask):
+    """
+    Use: touching = neighbours_any(mask)
+    Pre: mask is a 2D boolean numpy array
+    Post: touching[i,j] is True if any of the cells up, down, left or right of (i,j) is True in mask
+    """
+    touching = np.zeros(mask.shape, dtype=bool)
+    touching[1:, :] |= mask[:-1, :]
+    touching[:-1, :] |= mask[1:, :]
+    touching[:, 1:] |= mask[:, :-1]
+    touching[:, :-1] |= mask[:, 1:]
+    return touching
+
+
+
+def neighbours_count(mask):
+    """
+    Use: count = neighbours_count(mask)
+    Pre: mask is a 2D boolean numpy array
+    Post: count[i,j] is how many of the cells up, down, left and right of (i,j) are True in mask
+    """
+    count = np.zeros(mask.shape, dtype=np.uint8)
+    count[1:, :] += mask[:-1, :]
+    count[:-1, :] += mask[1:, :]
+    count[:, 1:] += mask[:, :-1]
+    count[:, :-1] += mask[:, 1:]
+    return count
+
+
+
+def label_regions(mask):
+    """
+    Use: labels, k = label_regions(mask)
+    Pre: mask is a 2D boolean numpy array
+    Post: labels is an integer array of the same shape as mask where cells that are False in mask are 0
+          and cells that are True are labelled 1-k, two cells have the same label if and only if one can
+          be reached from the other by going up, down, left or right through cells that are True in mask.
+    The labelling works on runs of True cells in each row, runs that overlap in neighbouring rows
+    are joined with union-find, so the python work is per run pair instead of per cell.
+    Two runs that overlap are only paired in the first column of the overlap, where one of them
+    starts, and the labels are int32, so the memory is a few bytes per cell.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    run_id = np.cumsum(starts.ravel(), dtype=np.int32).reshape(mask.shape)
+    run_id[~mask] = 0
+    runs = int(run_id.max()) if run_id.size else 0
+
+    both = mask[:-1, :] & mask[1:, :] & (starts[:-1, :] | starts[1:, :])
+    upper = run_id[:-1, :][both]
+    lower = run_id[1:, :][both]
+    pairs = np.unique(upper.astype(np.int64)*(runs + 1) + lower)
+
+    parent = list(range(runs + 1))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip((pairs // (runs + 1)).tolist(), (pairs % (runs + 1)).tolist()):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    roots = np.array([find(x) for x in range(runs + 1)])
+    roots, run_label = np.unique(roots, return_inverse=True)
+    return run_label.reshape(-1).astype(np.int32)[run_id], len(roots) - 1
+
+
+
+def seeds_to_mask(shape, seeds):
+    """
+    Use: seed_mask = seeds_to_mask(shape, seeds)
+    Pre: shape is the shape of a matrix and seeds is a list of tuples (i,j) of indexes in the matrix
+    Post: seed_mask is a boolean array of the given shape that is True at the seeds
+    """
+    seed_mask = np.zeros(shape, dtype=bool)
+    if len(seeds):
+        rows, cols = zip(*seeds)
+        seed_mask[list(rows), list(cols)] = True
+    return seed_mask
+
+
+
+def edge_seeds(mask):
+    """
+    Use: seeds = edge_seeds(mask)
+    Pre: mask is a 2D boolean numpy array
+    Post: seeds is a list of tuples (i,j), in row-major order, of the cells of mask in the first or last
+          row or column that are True. A flood fill from seeds reaches every cell of mask that is
+          connected to the edge of the matrix.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if mask.size == 0:
+        return []
+    edge = np.zeros(mask.shape, dtype=bool)
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    return [tuple(seed) for seed in np.argwhere(edge & mask).tolist()]
+
+
+
+def reachable_region(mask, seeds):
+    """
+    Use: region = reachable_region(mask, seeds)
+    Pre: mask is a 2D boolean numpy array, seeds is a list of tuples (i,j) of indexes in mask
+    Post: region is a boolean array that is True at the seeds and at every cell of mask that can be
+          reached from a seed by going up, down, left or right through cells of mask. A seed does
+          not have to be in mask itself, the cells of mask next to it are reached from it.
+    This gives the same cells as a flood fill from the seeds, but in linear time.
+    """
+    seed_mask = seeds_to_mask(mask.shape, seeds)
+    labels, k = label_regions(mask)
+    reached = np.zeros(k + 1, dtype=bool)
+    reached[labels[(seed_mask | neighbours_any(seed_mask)) & mask]] = True
+    reached[0] = False
+    return reached[labels] | seed_mask
@@ -1,7 +1,11 @@
 import numpy as np
-import matplotlib.pyplot as plt
+import functools
+import math
 from PIL import Image
 import os
+from concurrent.futures import ProcessPoolExecutor
+from FloodFill import edge_seeds, label_regions, neighbours_any, neighbours_count, reachable_region
+from PatternMatrix import PatternMatrix
 
 
 
@@ -15,63 +19,87 @@ def findNearestColor(value, colors):
 
 
 
-def ImageToMatrix(path, stitches, num_colors = 4):
+
+def floydSteinberg(img_array, colors, carry=None):
     """
-    Resize first and then decrease colors
+    Use: last_error = floydSteinberg(img_array, colors, carry)
+    Pre: img_array is a 2D float64 numpy array of gray values, colors is a sorted numpy
+         array of the gray levels to quantize to. carry is None or the quantization error
+         of the row directly above img_array (the return value of an earlier call).
+    Post: img_array has been quantized to colors in-place with Floyd-Steinberg error
+          diffusion and last_error is the quantization error of its last row.
+          The result is bit-identical to diffusing pixel by pixel with findNearestColor.
+          Only the error along a row is carried pixel by pixel, in plain python floats,
+          the errors to the next row are added a whole row at a time, in the same order
+          as the pixel by pixel loop adds them.
+    """
+    levels = [float(c) for c in colors]
+    rows, stitches = img_array.shape
+    if carry is not None and rows > 0:
+        _diffuseToNextRow(img_array[0], carry)
 
-    Use: Matrix = ImageToMatrix(path, stitches, num_colors)
-    Pre: path is the absolute path to an image that is to be converted in a string.
-         stitches is the number of columns to be in Matrix, num_colors is an integer
-         either 3 or 4 and represents how many colors are the be in Matrix
-    Post: Matrix is a matrix of integers from 1-3 or 1-4 depending on num_colors with the
-          lightest color in the gray scale being 1 and the darkest the highest number. Matrix
-          represents the image from path where it has been shrunken so that the number of
-          columns are equal to stitches. The Floyd-Steinberg algorithm is used to decrease the
-          number of colors.
+    errors = np.zeros(stitches)
+    for y in range(rows):
+        row = img_array[y].tolist()
+        row_errors = [0.0]*stitches
+        for x in range(stitches):
+            old_pixel = row[x]
+            new_pixel = levels[0]
+            distance = abs(new_pixel - old_pixel)
+            for level in levels[1:]:
+                if abs(level - old_pixel) < distance:
+                    new_pixel = level
+                    distance = abs(level - old_pixel)
+            row[x] = new_pixel
+            quant_error = old_pixel - new_pixel
+            row_errors[x] = quant_error
+            if x + 1 < stitches:
+                row[x + 1] += quant_error * 7 / 16
+        img_array[y] = row
+        errors = np.array(row_errors)
+        if y + 1 < rows:
+            _diffuseToNextRow(img_array[y + 1], errors)
+    return errors
+
+
+
+def _diffuseToNextRow(next_row, errors):
     """
-    img = Image.open(os.path.expanduser(path))
-    img = img.convert("L")
-    original_width,original_height = img.size
-    heightLengthRatio = original_height/original_width
-    rows = round(stitches*heightLengthRatio)
+    Adds the errors of a quantized row to next_row in-place,
+    each stitch gets 1/16, 5/16 and 3/16 from the stitches above it, in that order.
+    """
+    next_row[1:] += errors[:-1] * 1 / 16
+    next_row += errors * 5 / 16
+    next_row[:-1] += errors[1:] * 3 / 16
 
-    img.thumbnail((stitches, rows), Image.ANTIALIAS) # resizes image in-place
 
-    img_array = np.array(img) #image to numpy array
-    img_array = img_array/255.0 #skala gratona bilid
 
-    if img_array.shape[1] != stitches:
-        stitches = img_array.shape[1] 
+DITHER_MODES = ("floyd-steinberg", "bayer", "blue-noise", "none")
 
 
+
+def grayLevels(num_colors):
+    """
+    Use: colors = grayLevels(num_colors)
+    Pre: num_colors is either 3 or 4
+    Post: colors is a numpy array of the gray levels (0 is black, 1 is white)
+          that images are quantized to for a pattern with num_colors colors.
+    """
     if num_colors == 3:
-        colors = np.array([0, 0.5, 1])
+        return np.array([0, 0.5, 1])
     elif num_colors == 4:
-        colors = np.array([0, 0.33, 0.66, 1])
-    else:
-        raise ValueError(f"num cols is {num_colors}. num_colors must be either 3 or 4.")
-    
+        return np.array([0, 0.33, 0.66, 1])
+    raise ValueError(f"num cols is {num_colors}. num_colors must be either 3 or 4.")
 
-    # Error diffusion dithering (w Floyd-Steinberg algorithm)
-    for y in range(rows):
-        for x in range(stitches):
-            old_pixel = img_array[y, x]
-            new_pixel = findNearestColor(old_pixel, colors)
-            img_array[y, x] = new_pixel
-            quant_error = old_pixel - new_pixel
-            
-            if x + 1 < stitches:
-                img_array[y, x + 1] += quant_error *  7/ 16
-            if y + 1 < rows:
-                if x - 1 >= 0:
-                    img_array[y + 1, x - 1] += quant_error * 3 / 16
-                img_array[y + 1, x] += quant_error * 5 / 16
-                if x + 1 < stitches:
-                    img_array[y + 1, x + 1] += quant_error * 1 / 16
-
-    #plt.imshow(img_array,cmap="grey")
-    #plt.show()
-    
+
+
+def levelsToPattern(img_array, num_colors):
+    """
+    Use: Matrix = levelsToPattern(img_array, num_colors)
+    Pre: img_array is a numpy array that only contains the gray levels from grayLevels(num_colors)
+    Post: Matrix is a matrix of integers from 1-3 or 1-4 with the lightest gray level being 1
+          and the darkest the highest number. img_array is changed in-place.
+    """
     #set knitting pattern colors
     if num_colors==3:
         img_array[img_array==0.5] = 2
@@ -81,92 +109,410 @@ def ImageToMatrix(path, stitches, num_colors = 4):
         img_array[img_array==0.66] = 2
         img_array[img_array==0.33] = 3
         img_array[img_array==0.] = 4
-    
 
     return img_array.astype(int)
 
 
 
+def bayerMatrix(size=8):
+    """
+    Use: T = bayerMatrix(size)
+    Pre: size is a power of 2
+    Post: T is a size x size ordered dithering threshold map with values in (0,1)
+    """
+    bayer = np.zeros((1, 1))
+    while bayer.shape[0] < size:
+        bayer = np.block([[4*bayer, 4*bayer + 2],
+                          [4*bayer + 3, 4*bayer + 1]])
+    return ((bayer + 0.5)/bayer.size).astype(np.float32)
+
+
+
+@functools.lru_cache(maxsize=None)
+def blueNoiseMatrix(size=64, sigma=1.5):
+    """
+    Use: T = blueNoiseMatrix(size, sigma)
+    Pre: size is a positive integer, sigma is the width of the gaussian used to measure clustering
+    Post: T is a size x size blue noise threshold map with values in (0,1), made with the
+          void-and-cluster method. The map is deterministic and only computed once per size.
+          Treat T as read only.
+    """
+    n = size*size
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None]**2 + d[None, :]**2)/(2*sigma**2)).ravel()
+    rows, cols = np.divmod(np.arange(n), size)
+
+    def splat(idx):
+        #energy a point at flat index idx adds to every point (the kernel wraps around the edges)
+        return kernel[((rows - rows[idx]) % size)*size + (cols - cols[idx]) % size]
+
+    def tightestCluster(pattern, energy):
+        return np.argmax(np.where(pattern, energy, -np.inf))
+
+    def largestVoid(pattern, energy):
+        return np.argmin(np.where(pattern, np.inf, energy))
+
+    #random initial pattern relaxed until the tightest cluster is the largest void
+    rng = np.random.default_rng(0)
+    prototype = np.zeros(n, dtype=bool)
+    prototype[rng.choice(n, n//10, replace=False)] = True
+    energy = sum(splat(i) for i in np.flatnonzero(prototype))
+    while True:
+        cluster = tightestCluster(prototype, energy)
+        prototype[cluster] = False
+        energy -= splat(cluster)
+        void = largestVoid(prototype, energy)
+        prototype[void] = True
+        energy += splat(void)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(n)
+    ones = np.count_nonzero(prototype)
+    pattern, pattern_energy = prototype.copy(), energy.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = tightestCluster(pattern, pattern_energy)
+        pattern[cluster] = False
+        pattern_energy -= splat(cluster)
+        ranks[cluster] = rank
+    pattern, pattern_energy = prototype.copy(), energy.copy()
+    for rank in range(ones, n):
+        void = largestVoid(pattern, pattern_energy)
+        pattern[void] = True
+        pattern_energy += splat(void)
+        ranks[void] = rank
+    return ((ranks + 0.5)/n).reshape(size, size).astype(np.float32)
+
+
+
+def orderedDither(img_array, colors, dither="bayer", row_offset=0):
+    """
+    Use: quantized = orderedDither(img_array, colors, dither, row_offset)
+    Pre: img_array is a 2D numpy array of gray values from 0 to 1, colors is a sorted numpy
+         array of gray levels. dither is "bayer", "blue-noise" or "none". row_offset is the
+         row of a larger image that img_array starts at, so bands of an image line up.
+    Post: quantized has the shape of img_array and only contains values from colors.
+          With "none" every gray value is set to its nearest color (through a lookup table
+          of the 256 gray values of an 8 bit image), with "bayer" and "blue-noise" a gray
+          value between two colors is set to the darker or lighter one by comparing its
+          position between them to a tiled threshold map.
+    """
+    if dither == "none":
+        gray = np.clip(np.rint(img_array*255), 0, 255).astype(np.uint8)
+        lut = colors[np.argmin(np.abs(colors[None, :] - np.arange(256)[:, None]/255.0), axis=1)]
+        return lut[gray]
+
+    if dither == "bayer":
+        threshold = bayerMatrix()
+    elif dither == "blue-noise":
+        threshold = blueNoiseMatrix()
+    else:
+        raise ValueError(f"dither is {dither}. dither must be one of {DITHER_MODES}.")
+
+    rows, stitches = img_array.shape
+    k, l = threshold.shape
+    threshold = threshold[(np.arange(rows)[:, None] + row_offset) % k, np.arange(stitches)[None, :] % l]
+
+    img_array = img_array.astype(np.float32)
+    levels = colors.astype(np.float32)
+    lower = np.clip(np.searchsorted(levels, img_array, side="right") - 1, 0, len(levels) - 2)
+    darker, lighter = levels[lower], levels[lower + 1]
+    position = (img_array - darker)/(lighter - darker)
+    return np.where(position > threshold, colors[lower + 1], colors[lower])
+
+
+
+def thumbnailSize(image_size, size):
+    """
+    Use: final_size = thumbnailSize(image_size, size)
+    Pre: image_size is the (width, height) of an image, size is the (width, height) of a box
+    Post: final_size is the size PIL's thumbnail(size) gives an image of image_size,
+          the largest size that fits in the box with the aspect ratio of the image.
+    """
+    width, height = image_size
+    x, y = size
+    if x >= width and y >= height:
+        return image_size
+    aspect = width/height
+
+    def roundAspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    if x/y >= aspect:
+        x = roundAspect(y*aspect, key=lambda n: abs(aspect - n/y))
+    else:
+        y = roundAspect(x/aspect, key=lambda n: 0 if n == 0 else abs(aspect - x/n))
+    return x, y
+
+
+
+def decodeReduced(img, size, mode=None, reducing_gap=2.0):
+    """
+    Use: reduced, box = decodeReduced(Image.open(path), size, mode, reducing_gap)
+    Pre: img is an image from Image.open that has not been loaded yet, size is the (width, height)
+         it is going to be resized to, mode is None or the PIL mode it is to be converted to,
+         reducing_gap is None or a number greater than 1.
+    Post: reduced is img in mode, shrunk by the same integer factor as resize shrinks it with
+          reducing_gap before resampling, so the pixels are averaged in the same blocks as when img is
+          decoded in full. For JPEG images the largest draft scale (1/2, 1/4 or 1/8) that divides
+          that factor is decoded and reduce() does the rest, so the work and memory of the decoding
+          shrink with it. box is the area of the whole img in the pixel coordinates of reduced, to be
+          passed on to resize. If reducing_gap is None, or img is not going to be resized, img is
+          decoded in full.
+    """
+    box = (0, 0) + img.size
+    if reducing_gap is not None and size != img.size:
+        width, height = img.size
+        factor = (max(1, int(width/size[0]/reducing_gap)), max(1, int(height/size[1]/reducing_gap)))
+        scale = max(scale for scale in (1, 2, 4, 8) if factor[0] % scale == 0 and factor[1] % scale == 0)
+        draft = img.draft(mode if mode == "L" else None, (math.ceil(width/scale), math.ceil(height/scale))) #JPEG can decode straight to gray
+        if draft is not None:
+            box = draft[1]
+            scale = round(width/box[2])
+            factor = (factor[0]//scale, factor[1]//scale)
+        if mode is not None and img.mode != mode:
+            img = img.convert(mode) #converted before it is reduced, as when img is decoded in full
+        if factor != (1, 1) and img.mode in ("L", "RGB"):
+            img = img.reduce(factor, box=tuple(map(math.ceil, box)))
+            box = (0, 0, box[2]/factor[0], box[3]/factor[1])
+    if mode is not None and img.mode != mode:
+        img = img.convert(mode)
+    return img, box
+
+
+
+def quantizeGray(gray, num_colors=4, dither="floyd-steinberg"):
+    """
+    Use: Matrix = quantizeGray(gray, num_colors, dither)
+    Pre: gray is a 2D uint8 numpy array of a gray scale image, num_colors is either 3 or 4
+         and dither is one of DITHER_MODES.
+    Post: Matrix is the pattern matrix of gray with num_colors colors, as in ImageToMatrix.
+    """
+    img_array = gray/255.0 #skala gratona bilid
+    colors = grayLevels(num_colors)
+
+    if dither == "floyd-steinberg":
+        # Error diffusion dithering (w Floyd-Steinberg algorithm)
+        floydSteinberg(img_array, colors)
+    else:
+        img_array = orderedDither(img_array, colors, dither)
+
+    return levelsToPattern(img_array, num_colors)
+
+
 
-def ImageToMatrix2(path, stitches, num_colors=4):
+def ImageToMatrix(path, stitches, num_colors = 4, dither="floyd-steinberg", reducing_gap=2.0):
     """
-    Works the same is ImageToMatrix but 
-    decreases colors first and then resizes
+    Resize first and then decrease colors
+
+    Use: Matrix = ImageToMatrix(path, stitches, num_colors, dither, reducing_gap)
+    Pre: path is the absolute path to an image that is to be converted in a string.
+         stitches is the number of columns to be in Matrix, num_colors is an integer
+         either 3 or 4 and represents how many colors are the be in Matrix.
+         dither is one of DITHER_MODES.
+    Post: Matrix is a PatternMatrix of integers from 1-3 or 1-4 depending on num_colors with the
+          lightest color in the gray scale being 1 and the darkest the highest number. Matrix
+          represents the image from path where it has been shrunken so that the number of
+          columns are equal to stitches. The Floyd-Steinberg algorithm is used to decrease the
+          number of colors, unless dither is "bayer", "blue-noise" or "none" which use the much
+          faster but lower quality orderedDither.
+          The image is only decoded at reducing_gap times the size of Matrix (see decodeReduced),
+          with reducing_gap=None it is decoded in full before it is resized.
+    """
+    return PatternMatrix(quantizeGray(imageToGray(path, stitches, reducing_gap), num_colors, dither))
+
+
+
+def imageToGray(path, stitches, reducing_gap=2.0):
+    """
+    Use: gray = imageToGray(path, stitches, reducing_gap)
+    Post: gray is the image from path as a 2D uint8 numpy array of gray values, shrunken so that
+          it has stitches columns (or fewer if the image is smaller), as in ImageToMatrix.
+    """
+    img = Image.open(os.path.expanduser(path))
+    original_width,original_height = img.size
+    heightLengthRatio = original_height/original_width
+    rows = round(stitches*heightLengthRatio)
+
+    size = thumbnailSize(img.size, (stitches, rows))
+    img, box = decodeReduced(img, size, "L", reducing_gap)
+    if img.size != size:
+        img = img.resize(size, Image.Resampling.LANCZOS, box=box, reducing_gap=2.0) # as thumbnail does
+    return np.array(img)
+
+
+
+def iterImageToMatrix(path, stitches, num_colors=4, dither="floyd-steinberg", band_rows=256, reducing_gap=2.0):
+    """
+    Use: for band in iterImageToMatrix(path, stitches, num_colors, dither, band_rows): ...
+    Pre: the arguments are as in ImageToMatrix, band_rows is a positive integer
+    Post: the rows of ImageToMatrix(path, stitches, num_colors, dither, reducing_gap) are generated
+          from top to bottom in uint8 bands of band_rows rows. Only the uint8 gray image and one band
+          in floats are in memory, Floyd-Steinberg carries the error of the last row of a band to the
+          next one and the threshold maps of ordered dithering continue between bands, so the bands
+          are exactly the rows of ImageToMatrix.
+    """
+    gray = imageToGray(path, stitches, reducing_gap)
+    colors = grayLevels(num_colors)
+    if dither not in DITHER_MODES:
+        raise ValueError(f"dither is {dither}. dither must be one of {DITHER_MODES}.")
+    carry = None
+    for i in range(0, gray.shape[0], band_rows):
+        img_array = gray[i:i + band_rows]/255.0
+        if dither == "floyd-steinberg":
+            carry = floydSteinberg(img_array, colors, carry)
+        else:
+            img_array = orderedDither(img_array, colors, dither, row_offset=i)
+        yield levelsToPattern(img_array, num_colors).astype(np.uint8)
+
+
+
+
+def ImageToMatrix2(path, stitches, num_colors=4, dither=None, reducing_gap=2.0):
+    """
+    Works the same is ImageToMatrix but
+    decreases colors first and then resizes.
+    If dither is None the colors are decreased with an adaptive palette, otherwise
+    the gray scale image is dithered with the given mode from DITHER_MODES.
+    The colors are decreased on the image decoded at reducing_gap times the size of the
+    result (see decodeReduced), with reducing_gap=None on the full image.
     """
     image = Image.open(os.path.expanduser(path))
-    result = image.convert('P', palette=Image.ADAPTIVE, colors=num_colors)
     original_width,original_height = image.size
     heightLengthRatio = original_height/original_width
     rows = round(stitches*heightLengthRatio)
-    result.thumbnail((stitches, rows), Image.ANTIALIAS) # resizes image in-place
-    img_array = np.array(result) #image to numpy array
-    img_array[img_array==3] = 4
-    img_array[img_array==2] = 3
-    img_array[img_array==1] = 2
-    img_array[img_array==0] = 1
-    return img_array.astype(int)
+    size = thumbnailSize(image.size, (stitches, rows))
+    if dither is None:
+        image, box = decodeReduced(image, size, None, reducing_gap)
+        result = image.convert('P', palette=Image.ADAPTIVE, colors=num_colors)
+        if result.size != size:
+            result = result.resize(size, Image.NEAREST, box=box) # palette images are resized with NEAREST
+        img_array = np.array(result) #image to numpy array
+        img_array[img_array==3] = 4
+        img_array[img_array==2] = 3
+        img_array[img_array==1] = 2
+        img_array[img_array==0] = 1
+        return PatternMatrix(img_array)
+
+    image, box = decodeReduced(image, size, "L", reducing_gap)
+    result = Image.fromarray(quantizeGray(np.array(image), num_colors, dither).astype(np.uint8))
+    if result.size != size:
+        result = result.resize(size, Image.NEAREST, box=box) # like a palette image
+    return PatternMatrix(np.array(result))
 
 
 
 
 
-def removeSinglePixels(img_array, background_starts=None, matrix_background_color=1):
+def stitchSweep(path, stitch_counts, num_colors=4, dither="floyd-steinberg", reducing_gap=2.0, processes=None):
+    """
+    Use: sweep = stitchSweep(path, range(40, 181, 10), num_colors, dither)
+         Matrix = sweepMatrix(sweep, 70)
+    Pre: path is the path to an image, stitch_counts is an iterable of stitch counts,
+         num_colors, dither and reducing_gap are as in ImageToMatrix, processes is None
+         or the number of worker processes to quantize the matrices in, with None (or 1)
+         they are quantized in this process.
+    Post: sweep is a dictionary with the pattern matrices of the image for every stitch count,
+          sweep["stitches"] is a numpy array of the sorted stitch counts, sweep["rows"] and
+          sweep["columns"] are the number of rows and columns of each matrix (columns is less than
+          the stitch count if the image is too small), sweep["offsets"] are where each matrix starts
+          in sweep["data"], a single uint8 array of all the matrices one after the other.
+          The image is only decoded once, at reducing_gap times the largest matrix, and halved
+          into a pyramid from which each size is resized, so each matrix is as from
+          ImageToMatrix(path, stitches, num_colors, dither, reducing_gap) up to rounding.
+    """
+    stitch_counts = sorted(set(stitch_counts))
+    if not stitch_counts:
+        raise ValueError("stitch_counts is empty. At least one stitch count is needed.")
+    img = Image.open(os.path.expanduser(path))
+    original_width, original_height = img.size
+    sizes = [thumbnailSize(img.size, (stitches, round(stitches*original_height/original_width))) for stitches in stitch_counts]
+
+    base, box = decodeReduced(img, sizes[-1], "L", reducing_gap)
+    pyramid = [(base, box)]
+    gap = reducing_gap or 2.0
+    while pyramid[-1][1][2]/2 >= gap*sizes[0][0] and pyramid[-1][1][3]/2 >= gap*sizes[0][1]:
+        level, box = pyramid[-1]
+        pyramid.append((level.reduce(2, box=tuple(map(math.ceil, box))), (0, 0, box[2]/2, box[3]/2)))
+
+    grays = []
+    for size in sizes:
+        level, box = pyramid[0]
+        for smaller, smaller_box in pyramid[1:]:
+            if smaller_box[2] < gap*size[0] or smaller_box[3] < gap*size[1]:
+                break
+            level, box = smaller, smaller_box
+        if level.size != size:
+            level = level.resize(size, Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+        grays.append(np.array(level))
+
+    if not processes or processes == 1 or len(grays) == 1:
+        matrices = [quantizeGray(gray, num_colors, dither) for gray in grays]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            matrices = list(executor.map(quantizeGray, grays, [num_colors]*len(grays), [dither]*len(grays)))
+
+    shapes = np.array([matrix.shape for matrix in matrices], dtype=np.int64).reshape(-1, 2)
+    return {"stitches": np.array(stitch_counts),
+            "rows": shapes[:, 0],
+            "columns": shapes[:, 1],
+            "offsets": np.concatenate(([0], np.cumsum(shapes[:, 0]*shapes[:, 1])[:-1])),
+            "data": np.concatenate([matrix.astype(np.uint8).ravel() for matrix in matrices])}
+
+
+
+def sweepMatrix(sweep, stitches):
+    """
+    Use: Matrix = sweepMatrix(sweep, stitches)
+    Pre: sweep is from stitchSweep and stitches one of its stitch counts
+    Post: Matrix is the PatternMatrix of sweep for that stitch count, a view into sweep["data"]
+    """
+    index = np.flatnonzero(sweep["stitches"] == stitches)
+    if len(index) == 0:
+        raise ValueError(f"stitches is {stitches}. The sweep has the stitch counts {sweep['stitches'].tolist()}.")
+    i = index[0]
+    rows, columns, offset = sweep["rows"][i], sweep["columns"][i], sweep["offsets"][i]
+    return PatternMatrix(sweep["data"][offset:offset + rows*columns].reshape(rows, columns))
+
+
+
+def removeSinglePixels(img_array, background_starts=None, matrix_background_color=1, max_island_size=1):
     """
     If a non background pixel only has background pixels up,down,left and right of it, 
     it is changed to matrix_background_color.
     The function goes through the backround with flood-fill from each corner of the matrix.
-    For custom starts of the flood-fill let background_starts be a list of tuples (i,j) of 
+    For custom starts of the flood-fill let background_starts be a list of tuples (or lists) (i,j) of 
     the img_array indexes where the algorithm should start searching for single pixels.
+    With max_island_size=k every group of up to k connected non background pixels
+    (up,down,left and right) that is surrounded by background is changed as well.
+    With background_starts="auto" the search starts from all background pixels on the edge of the matrix.
     """
     matrix = np.copy(img_array)
     n, m = matrix.shape
     
-    if background_starts:
-        to_visit = set(background_starts)
+    if isinstance(background_starts, str) and background_starts == "auto":
+        to_visit = edge_seeds(matrix == matrix_background_color)
+    elif background_starts:
+        to_visit = list({tuple(int(i) for i in start) for start in background_starts}) # json gives starts as lists
     else:
-        to_visit = {(0, 0), (n-1, 0), (0, m-1), (n-1, m-1)}
-    
-    non_background_pixels = []
-    non_border_colors = {matrix_background_color, 13,11}
-    
-    while to_visit:
-        current = to_visit.pop()
-        x, y = current
-        
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx, ny = x + dx, y + dy
-            if 0 <= nx < n and 0 <= ny < m:
-                searching_idx = (nx, ny)
-                if matrix[searching_idx] == matrix_background_color and searching_idx not in to_visit:
-                    to_visit.add(searching_idx)
-                elif matrix[searching_idx] not in non_border_colors:
-                    non_background_pixels.append(searching_idx)
-                    matrix[current] = 13  # Mark it temporarily as part of the border
-        matrix[current] = 11
-    indices = matrix == 11 
-    matrix[indices] = matrix_background_color
-
-    while non_background_pixels:
-        current = non_background_pixels.pop(0)
-        x, y = current
-        
-        non_background_pixel_encountered = False
-        
-        #for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)]:
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx, ny = x + dx, y + dy
-            if 0 <= nx < n and 0 <= ny < m:
-                if matrix[(nx, ny)] != matrix_background_color:
-                    non_background_pixel_encountered = True
-                    break
-        
-        if not non_background_pixel_encountered:
-            matrix[current] = matrix_background_color
-    
-    indices = matrix == 13
-    matrix[indices] = img_array[indices]
+        to_visit = list({(0, 0), (n-1, 0), (0, m-1), (n-1, m-1)})
+
+    background = reachable_region(matrix == matrix_background_color, to_visit)
+    matrix[background] = matrix_background_color
 
-    return matrix
+    non_background = matrix != matrix_background_color
+    next_to_background = non_background & neighbours_any(background)
+    if max_island_size <= 1:
+        islands = next_to_background & (neighbours_count(non_background) == 0)
+    else:
+        labels, k = label_regions(non_background)
+        small = np.bincount(labels.ravel(), minlength=k + 1) <= max_island_size
+        touching = np.zeros(k + 1, dtype=bool)
+        touching[labels[next_to_background]] = True
+        islands = (small & touching)[labels] & non_background
+    matrix[islands] = matrix_background_color
+
+    return PatternMatrix(matrix)
 
 
 
@@ -174,35 +520,51 @@ def removeSinglePixels(img_array, background_starts=None, matrix_background_colo
 
 
 
+def hexToRgb(color):
+    """
+    Use: rgb = hexToRgb("#f7e35e")
+    Post: rgb is a tuple of the red, green and blue values (0-255) of the hex color
+    """
+    h = color.lstrip('#')
+    return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
+
+
+
+def renderColoredMatrix(matrix, colors, path=None, scale=1, stitch_aspect=1):
+    """
+    Use: image = renderColoredMatrix(patternMatrix, ["#f7e35e","#d14f90","#215215","#592222"], path)
+    Pre: matrix is a pattern matrix of integers from 1 to len(colors), colors is a list of hex colors
+         (or rgb tuples) where colors[0] is the color of 1, colors[1] the color of 2 and so on.
+         scale is the width of a stitch in pixels and stitch_aspect is the height of a stitch
+         relative to its width.
+    Post: image is a PIL RGB image of the pattern in the colors, made with a single lookup
+          in a palette table. If path is given the image has been saved there, in the format
+          of its file ending (e.g. .png or .webp). matplotlib is not needed.
+    """
+    palette = np.array([hexToRgb(color) if isinstance(color, str) else color for color in colors], dtype=np.uint8)
+    rgb_matrix = palette[np.asarray(matrix).astype(np.intp) - 1]
+    image = Image.fromarray(rgb_matrix, "RGB")
+
+    rows, stitches = rgb_matrix.shape[:2]
+    size = (stitches*scale, max(1, round(rows*scale*stitch_aspect)))
+    if size != image.size:
+        image = image.resize(size, Image.NEAREST)
+    if path is not None:
+        image.save(os.path.expanduser(path))
+    return image
+
+
+
 def viewColoredMatrix(matrix, color_1, color_2, color_3, color_4):
     """
     Use: viewColoredMatrix(patternMatrix, col_1, col_2, col_3, col_4)
     col_1,col_2,col_3,col_4 are strings of hex colors
     Post: a preview of the patternmatrix matrix win the hex colors
           col_1 is the lightest shade of color while color_4 is the darkest.
+          Use renderColoredMatrix to save a preview without showing it.
     """
-    #get RGB colors from hex
-    h1 = color_1.lstrip('#')
-    rgb1 = tuple(int(h1[i:i+2], 16) for i in (0, 2, 4))
-    h2 = color_2.lstrip('#')
-    rgb2 = tuple(int(h2[i:i+2], 16) for i in (0, 2, 4))
-    h3 = color_3.lstrip('#')
-    rgb3 = tuple(int(h3[i:i+2], 16) for i in (0, 2, 4))
-    h4 = color_4.lstrip('#')
-    rgb4 = tuple(int(h4[i:i+2], 16) for i in (0, 2, 4))
-    
-    rgb_colors = [rgb1, rgb2, rgb3, rgb4]
-    
-    # Create a new matrix with RGB values
-    rgb_matrix = []
-    for row in matrix:
-        rgb_row = [rgb_colors[val - 1] for val in row]
-        rgb_matrix.append(rgb_row)
-    
-    # Convert to numpy array
-    rgb_matrix_np = np.array(rgb_matrix, dtype=np.uint8)
-    
-    plt.imshow(rgb_matrix_np)
-    plt.show()
-
+    import matplotlib.pyplot as plt
 
+    image = renderColoredMatrix(matrix, [color_1, color_2, color_3, color_4])
+    plt.imshow(np.asarray(image))
+    plt.show()
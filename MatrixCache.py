@@ -0,0 +1,113 @@
+import numpy as np
+import os
+import json
+import hashlib
+import tempfile
+from ImageToPattern import ImageToMatrix
+from PatternMatrix import PatternMatrix
+
+
+CACHE_VERSION = 2 #change when ImageToMatrix gives new results for the same arguments
+
+
+
+class MatrixCache:
+    """
+    An on-disk cache of ImageToMatrix results, shared between processes.
+
+    Use: cache = MatrixCache("~/.cache/mynsturgerd", max_bytes=256*2**20)
+         matrix = cache.ImageToMatrix(path, stitches, num_colors, dither, reducing_gap)
+
+    Results are stored as uint8 .npy files named by a hash of the image bytes and the arguments,
+    so the same photo gives a hit even if it has been renamed or uploaded again. Files are written
+    to a temporary file and renamed into place, so processes never see half written results. When
+    the cache is larger than max_bytes the least recently used results are deleted.
+    hits and misses count how often a result was found in the cache, with bypass=True the cache
+    is not used at all.
+    """
+
+    def __init__(self, directory, max_bytes=256*2**20, bypass=False):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, path, stitches, num_colors=4, dither="floyd-steinberg", reducing_gap=2.0):
+        """
+        Returns the hex sha256 of the image file and the arguments of ImageToMatrix.
+        """
+        digest = hashlib.sha256()
+        with open(os.path.expanduser(path), "rb") as infile:
+            for block in iter(lambda: infile.read(2**20), b""):
+                digest.update(block)
+        if reducing_gap is not None:
+            reducing_gap = float(reducing_gap) #2 and 2.0 give the same result
+        digest.update(json.dumps([CACHE_VERSION, stitches, num_colors, dither, reducing_gap]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def ImageToMatrix(self, path, stitches, num_colors=4, dither="floyd-steinberg", reducing_gap=2.0, bypass=None):
+        """
+        Use: Matrix = cache.ImageToMatrix(path, stitches, num_colors, dither, reducing_gap, bypass)
+        Post: Matrix is ImageToMatrix(path, stitches, num_colors, dither, reducing_gap), from the cache if it is there.
+              bypass overrides the bypass of the cache for this call.
+        """
+        if self.bypass if bypass is None else bypass:
+            return ImageToMatrix(path, stitches, num_colors, dither=dither, reducing_gap=reducing_gap)
+
+        file = os.path.join(self.directory, self.key(path, stitches, num_colors, dither, reducing_gap) + ".npy")
+        try:
+            matrix = np.load(file)
+            os.utime(file)
+        except (OSError, ValueError):
+            pass
+        else:
+            self.hits += 1
+            return PatternMatrix(matrix)
+
+        self.misses += 1
+        matrix = ImageToMatrix(path, stitches, num_colors, dither=dither, reducing_gap=reducing_gap)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as outfile:
+                np.save(outfile, np.asarray(matrix))
+            os.replace(temporary, file)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+        return matrix
+
+    def evict(self):
+        """
+        Deletes the least recently used results until the cache is at most max_bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Deletes every result in the cache.
+        """
+        max_bytes, self.max_bytes = self.max_bytes, -1
+        self.evict()
+        self.max_bytes = max_bytes
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
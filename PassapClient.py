@@ -0,0 +1,225 @@
+import asyncio
+import json
+from urllib.parse import urlsplit
+from ProcessPatternsForMachine import NpEncoder, checkPatternMatrix, iterSeparatedColors
+
+
+class PassapClient:
+    """
+    An asyncio client that streams pattern lines to the passAPI endpoint of the passapE6000.
+
+    Use: async with PassapClient("http://localhost:3000") as client:
+             await client.stream(iterSeparatedColors(matrix), start)
+
+    The lines are sent in order in chunks of chunk_rows lines, each chunk as its own
+    {"start","pattern"} payload, over keep-alive connections that are reused between chunks.
+    While a chunk is being sent the next chunks are computed in a worker thread, but never more
+    than max_pending_chunks ahead, so a slow machine holds back the computation instead of
+    letting it fill the memory.
+    Each chunk is the next rows of the pattern, so a chunk that passAPI may have accepted is never
+    sent again, that would knit its rows twice. A request is only tried again when it provably was
+    not accepted: the connection could not be made, a reused keep-alive connection was closed before
+    any answer came, or passAPI answered 408 or 429. It is tried up to retries times, waiting backoff
+    seconds and then twice as long each time, or as long as the Retry-After header asks for.
+    Any other failure (timeouts, dropped connections after the chunk was sent, 5xx answers) raises a
+    ConnectionError right away.
+    """
+
+    def __init__(self, url="http://localhost:3000", chunk_rows=64, max_connections=2,
+                 max_pending_chunks=4, retries=3, backoff=0.5, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"url is {url}. Only http urls are supported.")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.chunk_rows = chunk_rows
+        self.max_pending_chunks = max_pending_chunks
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0 #number of requests sent, including retries
+        self._idle = [] #open keep-alive connections that are not in use
+        self._connections = asyncio.Semaphore(max_connections)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes all idle connections.
+        """
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _request(self, body):
+        """
+        Sends body and returns the status, headers and body of the answer.
+        Raises _NotSent if the request can not have reached passAPI.
+        """
+        async with self._connections:
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+            else:
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                except (OSError, asyncio.TimeoutError) as error:
+                    raise _NotSent(error) from error
+            try:
+                writer.write((f"POST {self.path} HTTP/1.1\r\n"
+                              f"Host: {self.host}:{self.port}\r\n"
+                              "Content-Type: application/json\r\n"
+                              f"Content-Length: {len(body)}\r\n"
+                              "Connection: keep-alive\r\n\r\n").encode("latin-1") + body)
+                self.requests += 1
+                await writer.drain()
+                status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not status_line:
+                    raise ConnectionResetError("passAPI closed the connection")
+            except BaseException as error:
+                writer.close()
+                if reused and isinstance(error, ConnectionError):
+                    # passAPI had closed the idle connection, it closes it instead of answering
+                    raise _NotSent(error) from error
+                raise
+            try:
+                status, headers, response = await asyncio.wait_for(_readResponse(status_line, reader), self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return status, headers, response
+
+    async def post(self, payload):
+        """
+        Use: status, response = await client.post(payload)
+        Post: payload has been sent as json to the endpoint and status and response are the
+              status code and body of the answer. Raises a ConnectionError if the endpoint refuses
+              the payload, if it could not be sent after retries tries or if the connection failed
+              after it was sent (then it may have been accepted and it is not sent again).
+        """
+        body = json.dumps(payload, cls=NpEncoder).encode("utf-8")
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                status, headers, response = await self._request(body)
+            except _NotSent as error:
+                failure = repr(error.__cause__)
+                wait = delay
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as error:
+                raise ConnectionError(f"The connection to {self.url} failed after the pattern was sent, it is not sent again "
+                                      f"since passAPI may have accepted it: {error!r}") from error
+            else:
+                if status < 400:
+                    return status, response
+                if status not in (408, 429):
+                    raise ConnectionError(f"passAPI refused the pattern with status {status}: {response[:200]!r}")
+                failure = f"status {status}"
+                retry_after = headers.get("retry-after", "")
+                wait = max(delay, float(retry_after)) if retry_after.isdigit() else delay
+            if attempt < self.retries:
+                await asyncio.sleep(wait)
+                delay *= 2
+        raise ConnectionError(f"Could not send the pattern to {self.url} in {self.retries + 1} tries, the last failure was {failure}")
+
+    async def stream(self, lines, start):
+        """
+        Use: sent = await client.stream(lines, start)
+        Pre: lines is an iterable (e.g. a generator) of pattern lines, such as iterSeparatedColors(A),
+             start is the start position on the needlebed from -90:90
+        Post: all lines have been sent in order and sent is the number of lines.
+        """
+        lines = iter(lines)
+        chunks = asyncio.Queue(maxsize=self.max_pending_chunks)
+
+        async def produce():
+            try:
+                while chunk := await asyncio.to_thread(_take, lines, self.chunk_rows):
+                    await chunks.put(chunk)
+            except Exception as error:
+                await chunks.put(error)
+            else:
+                await chunks.put(None)
+
+        producer = asyncio.create_task(produce())
+        sent = 0
+        try:
+            while (chunk := await chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                await self.post({"start":start, "pattern":chunk})
+                sent += len(chunk)
+        finally:
+            producer.cancel()
+        return sent
+
+
+
+class _NotSent(Exception):
+    """
+    A request that can not have reached passAPI, so it is safe to send it again.
+    """
+
+
+
+def _take(lines, n):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == n:
+            break
+    return chunk
+
+
+
+async def _readResponse(status_line, reader):
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        body = b""
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+    else:
+        body = await reader.read()
+        headers["connection"] = "close"
+    return status, headers, body
+
+
+
+def sendPattern(A, start, url="http://localhost:3000", **options):
+    """
+    Use: lines = sendPattern(A, start, url)
+    Pre: A is a pattern matrix, start is the start position on the needlebed from -90:90,
+         options are passed on to PassapClient.
+    Post: the separated colors of A have been streamed to passAPI at url and lines is the number
+          of lines sent. The lines are computed while the first ones are being sent.
+    """
+    checkPatternMatrix(A, start)
+
+    async def send():
+        async with PassapClient(url, **options) as client:
+            return await client.stream(iterSeparatedColors(A), start)
+
+    return asyncio.run(send())
@@ -0,0 +1,143 @@
+import numpy as np
+import os
+import json
+import zlib
+from ProcessPatternsForMachine import checkPatternMatrix, separateColorPlanes, writePatternJson
+from PatternMatrix import PatternMatrix
+
+
+ARCHIVE_MAGIC = b"MYNSTPAK"
+
+
+
+def writePatternArchive(A, start, file, repeat=2):
+    """
+    Use: writePatternArchive(A, start, file, repeat)
+    Pre: A is a pattern matrix, start is the start position on the needlebed from -90:90, file is the
+         path of the archive to write and repeat is how many times each line is knitted.
+    Post: The separated colors of A have been written to file in a binary archive that PatternArchive reads.
+          Each color plane of each row is stored once with np.packbits, 1 bit per stitch, and the
+          repeat factor is stored instead of duplicating the rows. The archive starts with ARCHIVE_MAGIC,
+          the length of a json header (8 bytes, little endian) and the header, with the start position,
+          the number of rows, stitches and colors, the repeat factor and the crc32 of the packed data.
+    """
+    checkPatternMatrix(A, start)
+    planes = separateColorPlanes(A, duplicate=False)
+    rows, stitches = np.shape(A)
+    num_colors = len(planes)//rows if rows else 0
+    packed = np.packbits(planes != 0, axis=1)
+    header = json.dumps({"start": int(start),
+                         "rows": rows,
+                         "stitches": stitches,
+                         "colors": num_colors,
+                         "repeat": repeat,
+                         "crc32": zlib.crc32(packed)}).encode("utf-8")
+    with open(os.path.expanduser(file), "wb") as outfile:
+        outfile.write(ARCHIVE_MAGIC)
+        outfile.write(len(header).to_bytes(8, "little"))
+        outfile.write(header)
+        outfile.write(packed.tobytes())
+
+
+
+class PatternArchive:
+    """
+    A pattern archive made with writePatternArchive, read through a memory map.
+
+    Use: archive = PatternArchive("~/path/to/pattern.pak")
+         archive.start, archive.rows, archive.stitches, archive.num_colors, archive.repeat
+         payload = archive.pattern()
+         for line in archive.iterLines(): ...
+
+    Only the rows that are asked for are read and unpacked, so a long pattern can be streamed to
+    passAPI or written to json without unpacking it all. With check=True the crc32 of the packed data
+    is checked when the archive is opened and a ValueError is raised if it does not match.
+    """
+
+    def __init__(self, file, check=True):
+        file = os.path.expanduser(file)
+        with open(file, "rb") as infile:
+            if infile.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{file} is not a pattern archive.")
+            header_length = int.from_bytes(infile.read(8), "little")
+            header = json.loads(infile.read(header_length).decode("utf-8"))
+        self.path = file
+        self.start = header["start"]
+        self.rows = header["rows"]
+        self.stitches = header["stitches"]
+        self.num_colors = header["colors"]
+        self.repeat = header["repeat"]
+        self.crc32 = header["crc32"]
+
+        row_bytes = (self.stitches + 7)//8
+        size = self.rows*self.num_colors*row_bytes
+        data_offset = len(ARCHIVE_MAGIC) + 8 + header_length
+        if os.path.getsize(file) != data_offset + size:
+            raise ValueError(f"{file} is {os.path.getsize(file)} bytes but its header says {data_offset + size}.")
+        if size:
+            self._packed = np.memmap(file, dtype=np.uint8, mode="r", offset=data_offset, shape=(self.rows*self.num_colors, row_bytes))
+        else:
+            self._packed = np.zeros((0, row_bytes), dtype=np.uint8)
+        if check and zlib.crc32(self._packed) != self.crc32:
+            raise ValueError(f"The checksum of {file} does not match, the archive is damaged.")
+
+    def __len__(self):
+        """
+        The number of lines that are knitted, i.e. of pattern()["pattern"].
+        """
+        return self.rows*self.num_colors*self.repeat
+
+    def planes(self, first_row=0, last_row=None):
+        """
+        Use: planes = archive.planes(first_row, last_row)
+        Post: planes is separateColorPlanes(A[first_row:last_row], duplicate=False) of the archived
+              matrix A, a uint8 numpy array, only those rows are unpacked.
+        """
+        first_row, last_row, _ = slice(first_row, last_row).indices(self.rows)
+        last_row = max(first_row, last_row)
+        bits = np.unpackbits(self._packed[first_row*self.num_colors:last_row*self.num_colors], axis=1, count=self.stitches)
+        colors = np.tile(np.arange(1, self.num_colors + 1, dtype=np.uint8), last_row - first_row)
+        return bits*colors[:, None]
+
+    def iterPlanes(self, block_rows=1024):
+        """
+        Use: for planes in archive.iterPlanes(block_rows): ...
+        Post: the planes of the archive are generated block_rows rows of the matrix at a time
+        """
+        for i in range(0, self.rows, block_rows):
+            yield self.planes(i, i + block_rows)
+
+    def iterLines(self, block_rows=64):
+        """
+        Use: for line in archive.iterLines(): ...
+        Post: the lines of pattern()["pattern"] are generated one at a time as uint8 arrays, each line
+              repeat times, only block_rows rows of the matrix are unpacked at a time.
+              The lines can be streamed with PassapClient.stream.
+        """
+        for planes in self.iterPlanes(block_rows):
+            yield from np.repeat(planes, self.repeat, axis=0)
+
+    def pattern(self):
+        """
+        Use: payload = archive.pattern()
+        Post: payload is the {"start","pattern"} object that patternMatrixToJson returns for the archived
+              matrix, with the lines as lists where the repeats of each line are the same list.
+              Use planes() for the lines as a uint8 numpy array.
+        """
+        return {"start":self.start, "pattern":[line for line in self.planes().tolist() for _ in range(self.repeat)]}
+
+    def matrix(self):
+        """
+        Use: A = archive.matrix()
+        Post: A is the archived pattern matrix as a PatternMatrix
+        """
+        planes = self.planes().reshape(self.rows, self.num_colors, self.stitches)
+        return PatternMatrix(planes.sum(axis=1, dtype=np.uint8))
+
+    def toJson(self, file, encoding="json"):
+        """
+        Use: archive.toJson(file, encoding)
+        Post: file is the pattern json that patternMatrixToJson(A, start, file, encoding) writes for the
+              archived matrix A, written a block of rows at a time.
+        """
+        writePatternJson(self.iterPlanes(), self.start, os.path.expanduser(file), encoding=encoding, repeat=self.repeat)
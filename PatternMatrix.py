@@ -0,0 +1,140 @@
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+
+
+class PatternMatrix(NDArrayOperatorsMixin):
+    """
+    A pattern matrix stored as a 2D uint8 numpy array, 1 byte per stitch instead of 8.
+
+    Use: matrix = PatternMatrix(A)
+         matrix.valid, matrix.num_colors, matrix.shape
+         A = np.asarray(matrix)
+
+    The functions of mynsturgerd return PatternMatrix and accept it wherever they accept a numpy
+    array. Everything else is done by the uint8 array: numpy functions, operators and ufuncs
+    (e.g. matrix == 1, np.isin(matrix, colors)) work on it and give numpy arrays, and attributes
+    such as matrix.shape, matrix.max() or matrix.astype(int) are the attributes of the array.
+    Arithmetic is done in uint8, as on any uint8 array, use matrix.astype(int) for signed results.
+
+    np.asarray(matrix) is a read only view of the array and indexing gives read only views, so
+    nothing is copied. Stitches are changed with matrix[i, j] = value, which clears the cached
+    validity and color count, so isPatternMatrix only checks the stitches again after a change.
+    A uint8 array given to PatternMatrix is used as is, not copied, if that array is changed
+    directly afterwards call matrix.invalidate().
+    """
+    __slots__ = ("_data", "_valid", "_num_colors")
+
+    def __init__(self, matrix):
+        data = matrix._data if isinstance(matrix, PatternMatrix) else np.asarray(matrix)
+        if data.ndim != 2:
+            raise ValueError(f"A pattern matrix must be 2D, the matrix has shape {data.shape}.")
+        if data.dtype != np.uint8:
+            converted = data.astype(np.uint8)
+            if not np.array_equal(converted, data):
+                raise ValueError("A pattern matrix can only contain integers 0-255.")
+            data = converted
+        self._data = data
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Clears the cached validity and color count, they are computed again when they are needed.
+        """
+        self._valid = None
+        self._num_colors = None
+
+    @property
+    def num_colors(self):
+        """
+        The largest color in the matrix (0 if it is empty), computed once.
+        """
+        if self._num_colors is None:
+            self._num_colors = int(self._data.max(initial=0))
+        return self._num_colors
+
+    @property
+    def valid(self):
+        """
+        True if the matrix has > 1 and <= 180 columns and only consists of the integers 0-4,
+        see isPatternMatrix. The stitches are only checked once.
+        """
+        if self._valid is None:
+            self._valid = 1 < self._data.shape[1] <= 180 and self.num_colors <= 4
+        return self._valid
+
+    def copy(self):
+        return PatternMatrix(self._data.copy())
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and np.dtype(dtype) != self._data.dtype:
+            return self._data.astype(dtype)
+        if copy:
+            return self._data.copy()
+        view = self._data.view()
+        view.flags.writeable = False
+        return view
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        inputs = tuple(_unwrap(x) for x in inputs)
+        if out is not None:
+            for x in out:
+                if isinstance(x, PatternMatrix):
+                    x.invalidate()
+            kwargs["out"] = tuple(x._data if isinstance(x, PatternMatrix) else x for x in out)
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if out is not None:
+            return out[0] if len(out) == 1 else out
+        return result
+
+    def __array_function__(self, func, types, args, kwargs):
+        return func(*_unwrap(args), **_unwrap(kwargs))
+
+    def __getattr__(self, name):
+        if name in PatternMatrix.__slots__:
+            raise AttributeError(name)
+        return getattr(self.__array__(), name)
+
+    def __getitem__(self, key):
+        result = self._data[_unwrap(key)]
+        if isinstance(result, np.ndarray) and np.may_share_memory(result, self._data):
+            result.flags.writeable = False
+        return result
+
+    def __setitem__(self, key, value):
+        self._data[_unwrap(key)] = _unwrap(value)
+        self.invalidate()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self.__array__())
+
+    def __reduce__(self):
+        return PatternMatrix, (self._data,)
+
+    def __repr__(self):
+        return "PatternMatrix(" + repr(self._data)[6:]
+
+
+
+def _unwrap(x):
+    if isinstance(x, PatternMatrix):
+        return x.__array__()
+    if isinstance(x, (list, tuple)):
+        return type(x)(_unwrap(y) for y in x)
+    if isinstance(x, dict):
+        return {key: _unwrap(value) for key, value in x.items()}
+    return x
+
+
+
+def asPatternMatrix(matrix):
+    """
+    Use: matrix = asPatternMatrix(A)
+    Post: matrix is A if A is a PatternMatrix, otherwise PatternMatrix(A)
+    """
+    if isinstance(matrix, PatternMatrix):
+        return matrix
+    return PatternMatrix(matrix)
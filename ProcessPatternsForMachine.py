@@ -1,5 +1,7 @@
 import numpy as np
 import json
+import base64
+from PatternMatrix import PatternMatrix
 
 class NpEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -24,6 +26,29 @@ def duplicateLines(matrix):
 
 
 
+def separateColorPlanes(A, duplicate=True, num_colors=None):
+    """
+    Use: planes = separateColorPlanes(A, duplicate, num_colors)
+    Pre: A is a pattern matrix of integers 1-4, num_colors is None or at least the largest color in A
+    Post: planes is a uint8 numpy array with a row for each color from 1 to num_colors (the largest
+          color in A if num_colors is None) for each row of A, the row of color c has c where the row of A has c
+          and 0 elsewhere. If duplicate is True every row is there twice in a row and planes
+          has shape (rows*colors*2, cols), otherwise it has shape (rows*colors, cols).
+    example: if A = [[1,2,3,4],[2,2,2,1]] then separateColorPlanes(A, duplicate=False) is
+        [[1,0,0,0],[0,2,0,0],[0,0,3,0],[0,0,0,4],[0,0,0,1],[2,2,2,0],[0,0,0,0],[0,0,0,0]]
+    """
+    if num_colors is None:
+        num_colors = A.num_colors if isinstance(A, PatternMatrix) else int(np.max(A))
+    A = np.asarray(A)
+    n, m = A.shape
+    colors = np.arange(1, num_colors + 1, dtype=np.uint8)[:, None]
+    planes = ((A[:, None, :] == colors)*colors).astype(np.uint8).reshape(n*len(colors), m)
+    if duplicate:
+        return np.repeat(planes, 2, axis=0)
+    return planes
+
+
+
 def separateColors(A):
     """ 
     The function takes in a pattern matrix A that consists only
@@ -33,22 +58,112 @@ def separateColors(A):
     then the return value of the function is:
         [[1,0,0,0],[1,0,0,0],[0,2,0,0],[0,2,0,0],[0,0,3,0],[0,0,3,0],[0,0,0,4],[0,0,0,4],
          [0,0,0,1],[0,0,0,1],[2,2,2,0],[2,2,2,0],[0,0,0,0],[0,0,0,0],[0,0,0,0],[0,0,0,0]]
+    This is the list form of separateColorPlanes(A).
+    """
+    return separateColorPlanes(A).tolist()
+
+
+
+def iterSeparatedColors(A, block_rows=64):
+    """
+    Use: for line in iterSeparatedColors(A): ...
+    Pre: A is a pattern matrix of integers 1-4
+    Post: the lines of separateColorPlanes(A) are generated one at a time as uint8 arrays,
+          only block_rows rows of A are separated at a time.
+    """
+    num_colors = A.num_colors if isinstance(A, PatternMatrix) else int(np.max(A))
+    for i in range(0, A.shape[0], block_rows):
+        yield from separateColorPlanes(A[i:i + block_rows], num_colors=num_colors)
+
+
+
+
+def iterSeparatedBands(bands, num_colors=4):
+    """
+    Use: for planes in iterSeparatedBands(bands, num_colors): ...
+    Pre: bands is an iterable of pattern matrices, the row bands of a pattern from top to bottom
+         (e.g. from iter_add_background), num_colors is at least the largest color in the pattern.
+    Post: separateColorPlanes(band, duplicate=False, num_colors) is generated for each band, so
+          writePatternJson(iterSeparatedBands(bands, num_colors), start, file) writes the pattern
+          one band at a time. Unlike separateColors the number of colors has to be known before the
+          first band, a color from 1 to num_colors that is not in the pattern gets empty rows.
+    """
+    for band in bands:
+        yield separateColorPlanes(band, duplicate=False, num_colors=num_colors)
+
+
+
+
+def planPasses(A, reorder=True):
+    """
+    Use: passes, report = planPasses(A, reorder)
+    Pre: A is a pattern matrix of integers 0-4
+    Post: passes is a uint8 numpy array with the carriage passes that knit A, in the layout of
+          separateColorPlanes(A, duplicate=False) (each pass is knitted twice) but without the passes
+          of colors that are not in a row. A row with no colors keeps one empty pass, so every row is
+          still knitted. If reorder is True the colors of each row are ordered so that the yarn is
+          changed as seldom as possible: a row starts with the color the row before it ended with when
+          it has it, and ends with a color the next rows start with, the colors in between are in
+          increasing order. The order is the best one over all rows, found with dynamic programming
+          over the color each row ends with.
+          report is a dictionary with the number of "rows", the "passes" and "color_changes" of
+          separateColorPlanes(A), the "planned_passes" and "planned_color_changes" of passes and the
+          "saved_passes". An empty pass does not change the yarn.
     """
-    res = []
+    num_colors = A.num_colors if isinstance(A, PatternMatrix) else int(np.max(A, initial=0))
+    A = np.asarray(A)
     n, m = A.shape
-    max = np.max(A)
-    for row in A:
-        lists = {i: [0]*m for i in range(1, max+1)}
-        for idx, value in enumerate(row):
-            lists[value][idx] = int(value)
-        for i in range(1, max+1):
-            #if any(lists[i]):
-                res.extend([lists[i], lists[i]])  # Add each list twice
-    return res
+    colors = np.arange(1, num_colors + 1)
+    present = (A[:, :, None] == colors).any(axis=1)
+    row_colors = [colors[row].tolist() for row in present]
+
+    if reorder:
+        #best[c] is the least number of yarn changes to knit the rows so far and end with color c
+        best = [0]*(num_colors + 1)
+        history = []
+        for row in row_colors:
+            if not row:
+                history.append((best, None))
+                continue
+            lowest = min(best[1:])
+            start_cost = {c: min(lowest + 1, best[c]) for c in row}
+            new_best = [np.inf]*(num_colors + 1)
+            firsts = [None]*(num_colors + 1)
+            for last in row:
+                for first in row:
+                    if (first != last or len(row) == 1) and start_cost[first] < new_best[last]:
+                        new_best[last], firsts[last] = start_cost[first], first
+            history.append((best, firsts))
+            best = new_best
+
+        last = int(np.argmin(best[1:])) + 1 if num_colors else 0
+        for i in range(n - 1, -1, -1):
+            previous_best, firsts = history[i]
+            if firsts is None:
+                continue
+            first = firsts[last]
+            middle = [c for c in row_colors[i] if c != first and c != last]
+            row_colors[i] = [first] + middle + ([last] if last != first else [])
+            lowest = min(previous_best[1:])
+            last = first if previous_best[first] <= lowest + 1 else previous_best.index(lowest, 1)
+
+    empty_row = [0] if num_colors else [] #a matrix of only zeros has no passes, as in separateColorPlanes
+    pass_rows = np.repeat(np.arange(n), [len(row or empty_row) for row in row_colors])
+    pass_colors = np.array([c for row in row_colors for c in (row or empty_row)], dtype=np.uint8)
+    passes = ((A[pass_rows] == pass_colors[:, None])*pass_colors[:, None]).astype(np.uint8)
+
+    yarn = pass_colors[pass_colors != 0]
+    report = {"rows": n,
+              "passes": n*num_colors,
+              "color_changes": (n*num_colors - 1) if num_colors > 1 else 0,
+              "planned_passes": len(passes),
+              "planned_color_changes": int(np.count_nonzero(yarn[1:] != yarn[:-1])),
+              "saved_passes": n*num_colors - len(passes)}
+    return passes, report
 
 
 
-def patternMatrixToJson(A,start,file):
+def patternMatrixToJson(A,start,file,encoding="json",plan_passes=False,return_pattern=True):
     """
     The function takes in a pattern matrix A and writes out a json object
     that is compatable with the pattern format that are sent with 
@@ -57,20 +172,163 @@ def patternMatrixToJson(A,start,file):
     start is the start position on the needlebed from -90:90
     file is the name and path of the output json file, 
      ex: /path/to/file/myPattern.json
+    encoding is "json" for the passAPI format, or "rle"/"base64" for a compact
+    archive format (see writePatternJson) that readPatternJson turns back into it.
+    If plan_passes is True the passes are from planPasses(A), without empty color passes and
+    with the colors of each row ordered to change the yarn as seldom as possible.
+    The returned pattern is the {"start","pattern"} object of the json file with the lines as lists,
+    as separateColors gives them, where the two copies of each line are the same list. With
+    return_pattern=False nothing is returned and only the file is written.
+    """
+    checkPatternMatrix(A, start)
+    if plan_passes:
+        planes, _ = planPasses(A)
+    else:
+        planes = separateColorPlanes(A, duplicate=False)
+    writePatternJson(planes, start, file, encoding=encoding)
+    if return_pattern:
+        return {"start":start, "pattern":[line for line in planes.tolist() for _ in range(2)]}
+
+
+
+def _rowToJson(row):
+    return "[" + ", ".join(map(str, row.tolist())) + "]"
+
+
+
+def _digitRowsToJson(rows):
+    """
+    Formats a 2D array of the digits 0-9 as json rows that each end with ", ",
+    e.g. [[1,0],[0,2]] -> '[1, 0], [0, 2], ', by writing the characters straight into a byte array.
+    """
+    k, m = rows.shape
+    text = np.full((k, 3*m + 2), ord(" "), dtype=np.uint8)
+    text[:, 0] = ord("[")
+    text[:, 1:3*m:3] = rows + ord("0")
+    text[:, 2:3*m - 1:3] = ord(",")
+    text[:, 3*m - 1] = ord("]")
+    text[:, 3*m] = ord(",")
+    return text.tobytes().decode("ascii")
+
+
+
+def _rowBlocks(rows, block_rows=1024):
+    if isinstance(rows, np.ndarray):
+        for i in range(0, len(rows), block_rows):
+            yield rows[i:i + block_rows]
+    else:
+        for row in rows:
+            row = np.asarray(row)
+            yield row if row.ndim == 2 else row[None, :]
+
+
+
+def _rowToRunLength(row):
+    """
+    [0,0,2,2,2,0] -> [0, 2, 2, 3, 0, 1], i.e. pairs of a value and how many times it repeats
+    """
+    starts = np.concatenate(([0], np.flatnonzero(row[1:] != row[:-1]) + 1))
+    counts = np.diff(np.append(starts, len(row)))
+    return _rowToJson(np.column_stack((row[starts], counts)).ravel())
+
+
+
+def _rowToBits(row):
+    """
+    [0,0,2,2,2,0] -> [2, "OA=="], i.e. the color of the row and its stitches as base64 of np.packbits
+    """
+    colors = np.unique(row[row != 0])
+    if len(colors) > 1:
+        raise ValueError(f"Only rows with one color can be bit packed, a row has the colors {colors}")
+    color = int(colors[0]) if len(colors) else 0
+    return f'[{color}, "{base64.b64encode(np.packbits(row != 0)).decode("ascii")}"]'
+
+
+
+PATTERN_ENCODINGS = {"json": _rowToJson, "rle": _rowToRunLength, "base64": _rowToBits}
+
+
+
+def writePatternJson(rows, start, file, encoding="json", repeat=2):
+    """
+    Use: writePatternJson(rows, start, file, encoding, repeat)
+    Pre: rows is a 2D numpy array or an iterable (e.g. a generator) of 1D numpy arrays of pattern rows
+         or of 2D blocks of them, e.g. separateColorPlanes(A, duplicate=False) or iterSeparatedBands(bands, 4). start is the start position on the needlebed
+         and file is the name and path of the output json file. Each row is knitted repeat times.
+         encoding is one of PATTERN_ENCODINGS.
+    Post: The pattern has been written to file a block of rows at a time, without building the whole
+          document in memory. With encoding="json" the file is the {"start","pattern"} object
+          that is sent to passAPI, the same as json.dumps writes, with every row repeat times.
+          With "rle" or "base64" each row is written once in compact form and the file has the
+          keys "encoding", "repeat" and "width" as well, readPatternJson reads all three formats.
+    """
+    if encoding not in PATTERN_ENCODINGS:
+        raise ValueError(f"encoding is {encoding}. encoding must be one of {list(PATTERN_ENCODINGS)}.")
+    rowToJson = PATTERN_ENCODINGS[encoding]
+    copies = repeat if encoding == "json" else 1
+    width = 0
+    with open(file, "w") as outfile:
+        outfile.write('{"start": ' + json.dumps(start, cls=NpEncoder))
+        if encoding != "json":
+            outfile.write(f', "encoding": "{encoding}", "repeat": {repeat}')
+        outfile.write(', "pattern": [')
+        separator = ""
+        for block in _rowBlocks(rows):
+            if len(block) == 0:
+                continue
+            width = block.shape[1]
+            digits = block.size and np.issubdtype(block.dtype, np.integer) and block.min() >= 0 and block.max() <= 9
+            if encoding == "json" and digits:
+                text = _digitRowsToJson(np.repeat(block, copies, axis=0))[:-2]
+            else:
+                text = ", ".join(rowToJson(row) for row in block for _ in range(copies))
+            outfile.write(separator + text)
+            separator = ", "
+        outfile.write("]")
+        if encoding != "json":
+            outfile.write(f', "width": {width}')
+        outfile.write("}")
+
+
+
+def readPatternJson(file):
+    """
+    Use: pattern = readPatternJson(file)
+    Pre: file is a pattern json file written with writePatternJson or patternMatrixToJson
+    Post: pattern is the {"start","pattern"} object that is sent to passAPI, with the
+          separated colors as a list of lists with every row as many times as it is knitted.
+    """
+    with open(file) as infile:
+        document = json.load(infile)
+    encoding = document.get("encoding", "json")
+    if encoding == "json":
+        return document
+
+    width = document["width"]
+    pattern = []
+    for row in document["pattern"]:
+        if encoding == "rle":
+            row = np.repeat(row[0::2], row[1::2])
+        else:
+            color, bits = row
+            row = np.unpackbits(np.frombuffer(base64.b64decode(bits), dtype=np.uint8))[:width]*color
+        row = [int(value) for value in row]
+        pattern.extend([row]*document["repeat"])
+    return {"start":document["start"], "pattern":pattern}
+
+
+
+
+def checkPatternMatrix(A, start):
+    """
+    Raises a ValueError if A is not a pattern matrix or doesn't fit
+    on the needlebed from the start position start.
     """
     n,m = A.shape
     if not isPatternMatrix(A):
         raise ValueError(f"Your matrix doesn't fullfill the requirements of being a pattern matrix. The matrix must have <= 180 columns and > 1 and only consist of integers 1-4. Your matrix has {m} columns")
     if start + m > 90:
         raise ValueError(f"The start position is too far to the right. Your matrix has {m} stitches and start position at {start}, {start+m-90} stitches would be missing")
-    
-    separatedColors = separateColors(A)
-    pattern = {"start":start, "pattern":separatedColors}
-
-    json_object = json.dumps(pattern, cls=NpEncoder)
-    with open(file, "w") as outfile:
-        outfile.write(json_object)
-    return pattern
 
 
 
@@ -79,7 +337,10 @@ def isPatternMatrix(A):
     """
     The function returns true if A fulfills requirements of being a pattern matrix
     i.e. has <= 180 columns and > 1 and consists only of the integers 0-4.
+    For a PatternMatrix the answer is cached until the matrix is changed.
     """
+    if isinstance(A, PatternMatrix):
+        return A.valid
     n,m = A.shape
     if m <=1 or m >180:
         return False
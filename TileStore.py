@@ -0,0 +1,142 @@
+import numpy as np
+import os
+import json
+import functools
+
+
+ARCHIVE_MAGIC = b"SJONABOK"
+_default_store = None
+
+
+
+def compile_tile_store(sjonabok_path, archive_path):
+    """
+    Use: tile_ids = compile_tile_store("~/path/to/Islensk-Sjonabok", "~/path/to/sjonabok.tiles")
+    Pre: sjonabok_path is the path to the Sjonabok folder with the .txt pattern files (in the npy_txt folders).
+    Post: every .txt pattern under sjonabok_path has been parsed once and stored as uint8 in one binary
+          archive at archive_path, which can be opened with TileStore. tile_ids is a list of the tile ids
+          in the archive, a tile id is the path of its file relative to sjonabok_path without the .txt ending.
+          A tile can also be looked up by its file name without .txt, as long as that name is unique.
+          Text files that are not patterns of integers are skipped.
+    """
+    sjonabok_path = os.path.expanduser(sjonabok_path)
+    tiles = {}
+    data = []
+    offset = 0
+    for folder, _, files in sorted(os.walk(sjonabok_path)):
+        for file in sorted(files):
+            if not file.endswith(".txt"):
+                continue
+            path = os.path.join(folder, file)
+            try:
+                tile = np.loadtxt(path, dtype=int, ndmin=2)
+            except ValueError:
+                continue
+            if tile.size == 0 or tile.min() < 0 or tile.max() > 255:
+                continue
+            tile_id = os.path.relpath(path, sjonabok_path)[:-len(".txt")].replace(os.sep, "/")
+            tiles[tile_id] = [offset, tile.shape[0], tile.shape[1]]
+            data.append(tile.astype(np.uint8).tobytes())
+            offset += tile.size
+
+    header = json.dumps({"tiles": tiles}).encode("utf-8")
+    with open(os.path.expanduser(archive_path), "wb") as outfile:
+        outfile.write(ARCHIVE_MAGIC)
+        outfile.write(len(header).to_bytes(8, "little"))
+        outfile.write(header)
+        for tile in data:
+            outfile.write(tile)
+    return list(tiles)
+
+
+
+class TileStore:
+    """
+    A read only store of Sjonabok tiles made with compile_tile_store.
+    The tiles are read from a memory map of the archive and the most recently
+    used ones are kept in memory, so only the tiles that are used are read from disk.
+
+    Use: store = TileStore("~/path/to/sjonabok.tiles")
+         tile = store["þjms6950_326"]
+    """
+
+    def __init__(self, archive_path, cache_size=256):
+        archive_path = os.path.expanduser(archive_path)
+        with open(archive_path, "rb") as infile:
+            if infile.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{archive_path} is not a Sjonabok tile archive.")
+            header_length = int.from_bytes(infile.read(8), "little")
+            header = json.loads(infile.read(header_length).decode("utf-8"))
+        data_offset = len(ARCHIVE_MAGIC) + 8 + header_length
+        self.path = archive_path
+        self.tiles = header["tiles"]
+        self._data = np.memmap(archive_path, dtype=np.uint8, mode="r", offset=data_offset) if self.tiles else None
+
+        names = {}
+        for tile_id in self.tiles:
+            names.setdefault(tile_id.rsplit("/", 1)[-1], []).append(tile_id)
+        self._names = {name: ids[0] for name, ids in names.items() if len(ids) == 1}
+        self._get = functools.lru_cache(maxsize=cache_size)(self._read)
+
+    def _tile_id(self, tile_id):
+        if tile_id in self.tiles:
+            return tile_id
+        return self._names.get(tile_id)
+
+    def _read(self, tile_id):
+        offset, rows, cols = self.tiles[tile_id]
+        tile = np.array(self._data[offset:offset + rows*cols]).reshape(rows, cols)
+        tile.flags.writeable = False
+        return tile
+
+    def __contains__(self, tile_id):
+        return isinstance(tile_id, str) and self._tile_id(tile_id) is not None
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __getitem__(self, tile_id):
+        """
+        Returns the tile with id (or unique file name) tile_id as a read only uint8 array.
+        """
+        full_id = self._tile_id(tile_id)
+        if full_id is None:
+            raise KeyError(f"There is no tile {tile_id} in {self.path}")
+        return self._get(full_id)
+
+
+
+def open_tile_store(archive_path, cache_size=256):
+    """
+    Use: store = open_tile_store("~/path/to/sjonabok.tiles")
+    Post: store is the TileStore of the archive and tile ids from it can be given instead of
+          file paths to add_border, add_background and add_background_seamless.
+    """
+    global _default_store
+    _default_store = TileStore(archive_path, cache_size)
+    return _default_store
+
+
+
+@functools.lru_cache(maxsize=256)
+def _load_txt(path, modified):
+    tile = np.loadtxt(path, dtype=int)
+    tile.flags.writeable = False
+    return tile
+
+
+
+def load_tile(tile):
+    """
+    Use: tile_matrix = load_tile(tile)
+    Pre: tile is the path to a Sjonabok .txt file, the id of a tile in the store opened with
+         open_tile_store or the tile itself as a numpy array.
+    Post: tile_matrix is a new integer numpy array of the tile that can be changed freely.
+          Text files are only parsed again if they have changed since they were last loaded.
+    """
+    if isinstance(tile, np.ndarray):
+        return tile.astype(int)
+    if _default_store is not None and tile in _default_store:
+        return _default_store[tile].astype(int)
+    path = os.path.abspath(os.path.expanduser(tile))
+    return _load_txt(path, os.path.getmtime(path)).astype(int)
@@ -1,4 +1,6 @@
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PatternMatrix import PatternMatrix
 
 def with_komma(letter, size = "small"):
     """
@@ -37,63 +39,215 @@ def write(letters, str, align="left",newline="˚", letter_spacing=0):
     """
     Use: write_matrix = write(letters,str, align, newline)
     Pre: str is the string to be written out, letters is a dictionary where each
-         symbol in str is a key and its value is a numpy matrix of the letter.
+         symbol in str is a key and its value is a numpy matrix of the letter,
+         or a GlyphAtlas of such a dictionary if the same font is used many times.
          align can either be "left" or "middle" and determines the way the text is aligned.
          newline is the symbol that defines a new line in text i.e. in str each symbol after
          a newline symbol is written in the next line.
     Post: write_matrix is a pattern matrix where the string str has been written out with the font 
-          provided in the letters dictionary.
+          provided in the letters dictionary. The matrix is a PatternMatrix and is made with
+          a single allocation, the text is measured first and then drawn into it.
+          With a dictionary only the letters in str are padded, with a GlyphAtlas none are.
     """
-    max_height = 0
-    for k in letters.keys():
-        if letters[k].shape[0] > max_height:
-            max_height = letters[k].shape[0]
-
-    written = np.zeros((max_height,1))
-    keep = np.zeros((max_height,1))
-    for i in str:
-        if i == newline:
-            if keep.shape[0] == 1 :
-                keep = written
-            else: 
-                l = keep.shape[1]
-                k = written.shape[1]
-                if l > k:
-                    if align=="middle":
-                        if (l-k)%2 == 0:
-                            boarder = np.zeros((written.shape[0],int((l-k)/2)))
-                            written = np.hstack((boarder,written,boarder))
-                        else: 
-                            boarder_l = np.zeros((written.shape[0],int((l-k-1)/2)))
-                            boarder_r = np.zeros((written.shape[0],int((l-k-1)/2+1)))
-                            written = np.hstack((boarder_l,written,boarder_r))
-                    else:
-                        written = np.hstack((written,np.zeros((written.shape[0],l-k))))
-                if k > l:
-                    if align=="middle":
-                        if (k-l)%2 == 0:
-                            boarder =np.zeros((keep.shape[0],int((k-l)/2)))
-                            keep = np.hstack((boarder,keep,boarder))
-                        else:
-                            boarder_l = np.zeros((keep.shape[0],int((k-l-1)/2)))
-                            boarder_r = np.zeros((keep.shape[0],int((k-l-1)/2+1)))
-                            keep = np.hstack((boarder_l,keep,boarder_r))
-                    else:
-
-                        keep = np.hstack((keep,np.zeros((keep.shape[0],k-l))))
-
-                keep = np.vstack((keep,np.zeros((2,keep.shape[1])),written))
-
-            written = np.zeros((max_height,1))
+    if not isinstance(letters, GlyphAtlas):
+        letters = GlyphAtlas(letters, symbols=set(str) - {newline})
+    rows, width, lines = layout(letters, str, align, newline, letter_spacing)
+    return PatternMatrix(write_layout(letters, rows, width, lines, letter_spacing))
+
+
+
+class GlyphAtlas:
+    """
+    A font for write, where every letter has been padded to the height of the tallest letter once.
+
+    Use: atlas = GlyphAtlas(letters, kommas, symbols)
+    Pre: letters is a dictionary where each key is a symbol and its value is a numpy matrix of the letter.
+         kommas is a dictionary of extra symbols made by with_komma, where the value of each symbol is
+         a tuple (symbol in letters, size), e.g. {"á": ("a", "small")}.
+         symbols is None or the symbols to put in the atlas, e.g. the symbols of one string.
+    Post: atlas can be given to write and write_batch instead of letters, the letters are then not padded
+          again on every call. The letters are stored as uint8. The letters are padded to the tallest
+          letter of the whole font even if only some symbols are in the atlas.
+    """
+
+    def __init__(self, letters, kommas={}, symbols=None):
+        if kommas:
+            letters = dict(letters)
+            for symbol, (letter, size) in kommas.items():
+                letters[symbol] = with_komma(letters[letter], size)
+
+        self.height = max((letter.shape[0] for letter in letters.values()), default=0)
+        if symbols is not None:
+            letters = {symbol: letters[symbol] for symbol in symbols}
+
+        self.glyphs = {}
+        self.widths = {}
+        self.ink = {}
+        for symbol, letter in letters.items():
+            glyph = np.zeros((self.height, letter.shape[1]), dtype=np.uint8)
+            glyph[self.height - letter.shape[0]:, :] = letter
+            self.glyphs[symbol] = glyph
+            self.widths[symbol] = letter.shape[1]
+            self.ink[symbol] = bool(np.any(letter))
+
+        # all glyphs side by side after an empty column, so text can be drawn with one lookup of columns
+        self.starts = {}
+        start = 1
+        for symbol, glyph in self.glyphs.items():
+            self.starts[symbol] = start
+            start += glyph.shape[1]
+        self._strip = None
+
+    @property
+    def strip(self):
+        """
+        The glyphs side by side after an empty column, made the first time it is used (by write_batch).
+        """
+        if self._strip is None:
+            self._strip = np.hstack([np.zeros((self.height, 1), dtype=np.uint8)] + list(self.glyphs.values()))
+        return self._strip
+
+
+
+def layout(atlas, str, align="left", newline="˚", letter_spacing=0):
+    """
+    Use: rows, width, lines = layout(atlas, str, align, newline, letter_spacing)
+    Pre: atlas is a GlyphAtlas and the rest is as in write
+    Post: rows and width are the shape of the matrix that write returns and lines is a list of
+          tuples (row, column, symbols) with where each line of symbols starts in that matrix.
+          Only the widths of the letters are used, nothing is drawn.
+    """
+    spacing = max(letter_spacing, 0)
+    height = atlas.height
+
+    # keep is the block of finished lines, it starts as an empty column like in write
+    keep_rows, keep_width, keep_lines, keep_ink = height, 1, [], False
+    line, line_width, line_ink = [], 1, False
+    for symbol in str:
+        if symbol == newline:
+            if keep_rows == 1:
+                keep_rows, keep_width, keep_lines, keep_ink = height, line_width, [(0, 0, line)], line_ink
+            else:
+                offset = 0
+                if keep_width > line_width and align == "middle":
+                    offset = (keep_width - line_width)//2
+                if line_width > keep_width:
+                    if align == "middle":
+                        shift = (line_width - keep_width)//2
+                        keep_lines = [(row, column + shift, symbols) for row, column, symbols in keep_lines]
+                    keep_width = line_width
+                keep_lines.append((keep_rows + 2, offset, line))
+                keep_rows += 2 + height
+                keep_ink = keep_ink or line_ink
+            line, line_width, line_ink = [], 1, False
         else:
-            add_height = max_height - letters[i].shape[0]
-            letter = np.vstack((np.zeros((add_height,letters[i].shape[1])),letters[i]))
-            if letter_spacing > 0:
-                letter = np.hstack((np.zeros((letter.shape[0],letter_spacing)),letter))
-            written = np.hstack((written,letter))
-    
-    if np.any(keep):
-        written = keep
+            line.append(symbol)
+            line_width += spacing + atlas.widths[symbol]
+            line_ink = line_ink or atlas.ink[symbol]
+
+    if keep_ink:
+        return keep_rows, keep_width + 1, keep_lines
+    return height, line_width + 1, [(0, 0, line)]
+
 
-    written = np.hstack((written,np.zeros((written.shape[0],1))))
+
+def write_layout(atlas, rows, width, lines, letter_spacing=0):
+    """
+    Use: write_matrix = write_layout(atlas, rows, width, lines, letter_spacing)
+    Pre: rows, width, lines are from layout(atlas, ...) with the same letter_spacing
+    Post: write_matrix is a uint8 matrix of shape (rows, width) with every line drawn where layout placed it.
+    """
+    spacing = max(letter_spacing, 0)
+    written = np.zeros((rows, width), dtype=np.uint8)
+    for row, column, symbols in lines:
+        column += 1
+        for symbol in symbols:
+            column += spacing
+            glyph = atlas.glyphs[symbol]
+            written[row:row + atlas.height, column:column + glyph.shape[1]] = glyph
+            column += glyph.shape[1]
     return written
+
+
+
+def _write_lines(atlas, strings, letter_spacing=0):
+    """
+    Use: written, widths = _write_lines(atlas, strings, letter_spacing)
+    Pre: strings is a list of strings without newlines
+    Post: written is a uint8 array of shape (len(strings), atlas.height, max(widths)) where written[i,:,:widths[i]]
+          is write(atlas, strings[i], letter_spacing=letter_spacing). All the strings are measured with whole array
+          operations and drawn with one lookup of columns in atlas.strip.
+    """
+    spacing = max(letter_spacing, 0)
+    symbols = [symbol for string in strings for symbol in string]
+    string_of_symbol = np.repeat(np.arange(len(strings)), [len(string) for string in strings])
+    columns = spacing + np.array([atlas.widths[symbol] for symbol in symbols], dtype=np.intp)
+    starts = np.array([atlas.starts[symbol] for symbol in symbols], dtype=np.intp)
+    text_widths = np.bincount(string_of_symbol, weights=columns, minlength=len(strings)).astype(np.intp)
+    widths = text_widths + 2
+
+    # for every column of text, which string it is in, where in the string and which column of atlas.strip it shows
+    total = int(columns.sum())
+    within = np.arange(total) - np.repeat(np.cumsum(columns) - columns, columns)
+    source = np.where(within < spacing, 0, np.repeat(starts - spacing, columns) + within)
+    string_of_column = np.repeat(string_of_symbol, columns)
+    destination = 1 + np.arange(total) - (np.cumsum(text_widths) - text_widths)[string_of_column]
+
+    index = np.zeros((len(strings), int(widths.max(initial=0))), dtype=np.intp)
+    index[string_of_column, destination] = source
+    return atlas.strip[:, index].transpose(1, 0, 2), widths
+
+
+
+def _write_batch(atlas, strings, align, newline, letter_spacing):
+    matrices = [None]*len(strings)
+    lines = [i for i, string in enumerate(strings) if newline not in string]
+    written, widths = _write_lines(atlas, [strings[i] for i in lines], letter_spacing)
+    for j, i in enumerate(lines):
+        matrices[i] = PatternMatrix(written[j, :, :widths[j]])
+    for i, string in enumerate(strings):
+        if matrices[i] is None:
+            matrices[i] = write(atlas, string, align, newline, letter_spacing)
+    return matrices
+
+
+
+def _write_batch_chunk(arguments):
+    return _write_batch(*arguments)
+
+
+
+def write_batch(letters, strings, align="left", newline="˚", letter_spacing=0, stack=False, processes=None, stack_spacing=0):
+    """
+    Use: write_matrices = write_batch(letters, strings, align, newline, letter_spacing, stack, processes, stack_spacing)
+    Pre: strings is a list of strings and the rest is as in write, processes is None or the number
+         of worker processes to split the strings between, stack_spacing is a number of rows.
+    Post: If stack is False write_matrices is a list where write_matrices[i] is write(letters, strings[i], ...).
+          If stack is True write_matrices is one PatternMatrix with the matrices on top of each other, in order
+          from the top, with stack_spacing rows of zeros between them. Each matrix is padded with zeros to the
+          width of the widest one, on the right, or on both sides if align is "middle", so the stack can be
+          given to add_border and separateColors.
+    The font is only padded once and all strings without a newline are measured and drawn together.
+    """
+    if not isinstance(letters, GlyphAtlas):
+        letters = GlyphAtlas(letters)
+
+    if processes and len(strings) > 1:
+        size = -(-len(strings)//processes)
+        chunks = [(letters, strings[i:i + size], align, newline, letter_spacing) for i in range(0, len(strings), size)]
+        with ProcessPoolExecutor(processes) as pool:
+            matrices = [matrix for part in pool.map(_write_batch_chunk, chunks) for matrix in part]
+    else:
+        matrices = _write_batch(letters, strings, align, newline, letter_spacing)
+
+    if not stack:
+        return matrices
+    rows = sum(matrix.shape[0] for matrix in matrices) + stack_spacing*max(len(matrices) - 1, 0)
+    columns = max((matrix.shape[1] for matrix in matrices), default=0)
+    stacked = np.zeros((rows, columns), dtype=np.uint8)
+    top = 0
+    for matrix in matrices:
+        left = (columns - matrix.shape[1])//2 if align == "middle" else 0
+        stacked[top:top + matrix.shape[0], left:left + matrix.shape[1]] = matrix
+        top += matrix.shape[0] + stack_spacing
+    return PatternMatrix(stacked)
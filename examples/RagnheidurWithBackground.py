@@ -1,7 +1,5 @@
 import numpy as np
 import os
-import requests
-import matplotlib.pyplot as plt
 from ProcessPatternsForMachine import *
 from ImageToPattern import *
 from AddBackgroundAndBorder import *
@@ -25,12 +23,19 @@ start = -60
 
 #post request for passapE6000
 """
+import requests
 r = requests.post('http://localhost:3000'), json={
     "start":start,
     "pattern":pattern
 })
 """
 
+#or stream the pattern to passAPI while it is being separated
+"""
+from PassapClient import sendPattern
+sendPattern(matrix, start, 'http://localhost:3000')
+"""
+
 
 
 
@@ -0,0 +1,324 @@
+"""
+Command line pipeline for mynsturgerd, from an image to a pattern for the passapE6000.
+
+Use: python mynsturgerd.py run config.json
+     python mynsturgerd.py batch config.json ~/path/to/images ~/path/to/output [--processes 8]
+     python mynsturgerd.py compile-tiles ~/path/to/Islensk-Sjonabok ~/path/to/sjonabok.tiles
+
+The config is a json object, see examples/pattern_config.json:
+    "image", "stitches", "num_colors", "dither"   arguments of ImageToMatrix
+    "cache"           optional keyword arguments of MatrixCache (directory, max_bytes, bypass)
+                      to reuse the dithered matrix of an image that has been converted before
+    "tile_store"      optional tile archive from compile-tiles, its tile ids can then be used as tile paths
+    "steps"           list of steps done in order on the matrix, each step is an object with one
+                      of the keys "removeSinglePixels", "add_border", "add_background" or
+                      "add_background_seamless" and the keyword arguments of that function as value,
+                      consecutive border and background steps are done on one canvas with compose_layers
+    "start"           start position on the needlebed
+    "output"          json file to write the pattern to, "encoding" and "plan_passes" are passed to patternMatrixToJson
+    "archive"         optional file to write the pattern to as a bit packed PatternArchive
+    "preview"         optional keyword arguments of renderColoredMatrix (path, colors, scale, stitch_aspect)
+    "send"            optional passAPI url to stream the pattern to
+    "band_rows"       optional, runs the pipeline in bands of band_rows rows (see run_bands) for very
+                      long panels, then only the add_background steps and "output" (without "plan_passes")
+                      can be used, and the json has a pass for every color the steps can give
+
+batch runs the same config on every image of a folder (and its subfolders) or of a manifest,
+a text file with the path of one image per line, and ignores the "image", "output" and "send"
+keys of the config. Each pattern is written to the output folder as .npy and .json (and a .png
+preview if the config has "preview" and a .pak archive if it has "archive"), together with a
+summary.json of all images.
+
+Only the modules a config needs are imported, and matplotlib never is,
+so short lived workers start quickly.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+
+
+def run(config):
+    """
+    Use: matrix = run(config)
+    Pre: config is a dictionary as described in the module docstring
+    Post: the pipeline of config has been run and matrix is the final pattern matrix
+    """
+    from ImageToPattern import ImageToMatrix, removeSinglePixels
+    from AddBackgroundAndBorder import add_border, add_background, add_background_seamless, compose_layers
+
+    steps = {"removeSinglePixels": removeSinglePixels,
+             "add_border": add_border,
+             "add_background": add_background,
+             "add_background_seamless": add_background_seamless}
+
+    if "tile_store" in config:
+        from TileStore import open_tile_store
+        open_tile_store(config["tile_store"])
+
+    if "cache" in config:
+        from MatrixCache import MatrixCache
+        ImageToMatrix = MatrixCache(**config["cache"]).ImageToMatrix
+    matrix = ImageToMatrix(config["image"], config["stitches"], config.get("num_colors", 4),
+                           dither=config.get("dither", "floyd-steinberg"))
+    layers = [] #consecutive border and background steps are composed on one canvas
+    for step in config.get("steps", []) + [None]:
+        if step is not None:
+            (name, arguments), = step.items()
+            if name not in steps:
+                raise ValueError(f"step is {name}. A step must be one of {list(steps)}.")
+            if name != "removeSinglePixels":
+                layers.append(step)
+                continue
+        if layers:
+            matrix = compose_layers(matrix, layers)
+            layers = []
+        if step is not None:
+            matrix = steps[name](matrix, **arguments)
+
+    if "preview" in config:
+        from ImageToPattern import renderColoredMatrix
+        renderColoredMatrix(matrix, **config["preview"])
+
+    start = config.get("start", 0)
+    if "output" in config:
+        from ProcessPatternsForMachine import patternMatrixToJson
+        patternMatrixToJson(matrix, start, os.path.expanduser(config["output"]), encoding=config.get("encoding", "json"),
+                            plan_passes=config.get("plan_passes", False), return_pattern=False)
+    if "archive" in config:
+        from PatternArchive import writePatternArchive
+        writePatternArchive(matrix, start, config["archive"])
+    if "send" in config:
+        from PassapClient import sendPattern
+        sendPattern(matrix, start, config["send"])
+    return matrix
+
+
+
+def run_bands(config):
+    """
+    Use: rows, stitches = run_bands(config)
+    Pre: config is a dictionary as described in the module docstring with "band_rows",
+         its steps can only be "add_background" and "add_background_seamless".
+    Post: the pipeline of config has been run on bands of band_rows rows from the top of the pattern
+          to the bottom, through generators, and rows x stitches is the size of the pattern. The pattern
+          is never in memory as a whole, so the memory does not grow with the length of the panel.
+          The background is only filled forward from band to band (see iter_add_background), a warning
+          is given if some background could only be reached from below and is not filled, then the
+          pattern differs from run(config). The color planes are for every color up to the largest one
+          the config can give, since the json is written before the last band is known, so when the
+          pattern uses fewer colors the json has an empty pass for each missing color in every row
+          that the json of run(config) does not have.
+    """
+    from ImageToPattern import iterImageToMatrix
+    from AddBackgroundAndBorder import iter_add_background
+    from ProcessPatternsForMachine import checkPatternMatrix, iterSeparatedBands, writePatternJson
+
+    for key in ("preview", "send", "archive"):
+        if key in config:
+            raise ValueError(f"config has {key}. {key} can not be used with band_rows.")
+    if config.get("plan_passes"):
+        raise ValueError("config has plan_passes. plan_passes can not be used with band_rows.")
+    if "tile_store" in config:
+        from TileStore import open_tile_store
+        open_tile_store(config["tile_store"])
+
+    num_colors = config.get("num_colors", 4)
+    bands = iterImageToMatrix(config["image"], config["stitches"], num_colors,
+                              dither=config.get("dither", "floyd-steinberg"), band_rows=config["band_rows"])
+    for step in config.get("steps", []):
+        (name, arguments), = step.items()
+        if name not in ("add_background", "add_background_seamless"):
+            raise ValueError(f"step is {name}. With band_rows a step must be add_background or add_background_seamless.")
+        arguments = dict(arguments)
+        if name == "add_background" and not arguments.get("background_starts"):
+            arguments["background_starts"] = None #the corners, as in add_background
+        num_colors = max(num_colors, arguments.get("background_color_0", 1), arguments.get("background_color_1", 4),
+                         arguments.get("border_color", 1) if arguments.get("border", True) else 1)
+        bands = iter_add_background(bands, **arguments)
+
+    start = config.get("start", 0)
+    shape = [0, 0]
+    def checked(bands):
+        for band in bands:
+            checkPatternMatrix(band, start)
+            shape[0] += band.shape[0]
+            shape[1] = band.shape[1]
+            yield band
+
+    if "output" in config:
+        writePatternJson(iterSeparatedBands(checked(bands), num_colors), start, os.path.expanduser(config["output"]),
+                         encoding=config.get("encoding", "json"))
+    else:
+        for _ in checked(bands):
+            pass
+    return tuple(shape)
+
+
+
+def find_images(source):
+    """
+    Use: images = find_images(source)
+    Pre: source is the path to a folder of images or to a manifest, a text file with the path of
+         one image per line (relative paths are relative to the manifest, empty lines and lines
+         starting with # are skipped)
+    Post: images is a sorted list of (path, name) of the images, where name is the path of the
+          image relative to source without its file ending, unique for each image
+    """
+    source = os.path.expanduser(source)
+    images = []
+    if os.path.isdir(source):
+        for folder, _, files in os.walk(source):
+            for file in files:
+                if file.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(folder, file)
+                    images.append((path, os.path.splitext(os.path.relpath(path, source))[0]))
+    else:
+        base = os.path.dirname(source)
+        with open(source) as infile:
+            for line in infile:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    path = os.path.join(base, os.path.expanduser(line))
+                    images.append((path, os.path.splitext(os.path.basename(path))[0]))
+
+    names = set()
+    unique = []
+    for path, name in sorted(images):
+        candidate, i = name, 1
+        while candidate in names:
+            i += 1
+            candidate = f"{name}_{i}"
+        names.add(candidate)
+        unique.append((path, candidate))
+    return unique
+
+
+
+def _run_image(config, path, name, output_dir):
+    """
+    Runs config on the image at path and writes the results to output_dir/name.*,
+    returns a report of the image instead of raising errors.
+    """
+    started = time.perf_counter()
+    report = {"image": path, "name": name}
+    try:
+        import numpy as np
+
+        base = os.path.join(output_dir, name)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        config = {key: value for key, value in config.items() if key != "send"}
+        config["image"] = path
+        config["output"] = base + ".json"
+        if "preview" in config:
+            config["preview"] = dict(config["preview"], path=base + ".png")
+        if "archive" in config:
+            config["archive"] = base + ".pak"
+        matrix = run(config)
+        np.save(base + ".npy", matrix.astype(np.uint8))
+        report.update(rows=matrix.shape[0], stitches=matrix.shape[1], npy=base + ".npy", json=base + ".json")
+        if "archive" in config:
+            report["archive"] = config["archive"]
+    except Exception as error:
+        report["error"] = f"{type(error).__name__}: {error}"
+        report["traceback"] = traceback.format_exc()
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+
+def run_batch(config, source, output_dir, processes=None):
+    """
+    Use: for report in run_batch(config, source, output_dir, processes): ...
+    Pre: config is a dictionary as described in the module docstring, source is a folder of
+         images or a manifest (see find_images), output_dir is the folder to write the patterns to,
+         processes is the number of worker processes (None for one per cpu)
+    Post: The pipeline of config has been run on every image of source in a process pool.
+          A report is yielded for each image as soon as it is done, in the order they finish,
+          with the keys "image", "name", "seconds" and either "rows", "stitches", "npy" and "json"
+          (and "archive" if the config has "archive")
+          or "error" and "traceback" if the image failed. A failed image does not stop the others.
+          When all images are done output_dir/summary.json has the reports of all of them.
+    """
+    if "band_rows" in config:
+        raise ValueError("config has band_rows. band_rows can not be used in a batch.")
+    output_dir = os.path.expanduser(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    images = find_images(source)
+    started = time.perf_counter()
+    reports = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(_run_image, config, path, name, output_dir): (path, name) for path, name in images}
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as error: #the worker process died
+                path, name = futures[future]
+                report = {"image": path, "name": name, "error": f"{type(error).__name__}: {error}"}
+            reports.append(report)
+            yield report
+
+    failed = [report for report in reports if "error" in report]
+    summary = {"source": source,
+               "images": len(reports),
+               "converted": len(reports) - len(failed),
+               "failed": len(failed),
+               "seconds": round(time.perf_counter() - started, 3),
+               "reports": sorted(reports, key=lambda report: report["name"])}
+    with open(os.path.join(output_dir, "summary.json"), "w") as outfile:
+        json.dump(summary, outfile, indent=2, ensure_ascii=False)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mynsturgerd", description="Automatic pattern making for the passapE6000 knitting machine.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the pipeline of a json config file")
+    run_parser.add_argument("config", help="path to the json config file")
+
+    batch_parser = commands.add_parser("batch", help="run the pipeline of a json config file on a folder of images in parallel")
+    batch_parser.add_argument("config", help="path to the json config file")
+    batch_parser.add_argument("source", help="folder of images or a text file with one image path per line")
+    batch_parser.add_argument("output", help="folder to write the patterns and summary.json to")
+    batch_parser.add_argument("--processes", type=int, default=None, help="number of worker processes, one per cpu by default")
+
+    compile_parser = commands.add_parser("compile-tiles", help="compile the Sjonabok .txt files into a tile archive")
+    compile_parser.add_argument("sjonabok", help="path to the Sjonabok folder")
+    compile_parser.add_argument("archive", help="path of the tile archive to write")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        with open(os.path.expanduser(args.config)) as infile:
+            config = json.load(infile)
+        rows, stitches = run_bands(config) if "band_rows" in config else run(config).shape
+        print(f"{rows} rows x {stitches} stitches")
+    elif args.command == "batch":
+        with open(os.path.expanduser(args.config)) as infile:
+            config = json.load(infile)
+        failed = 0
+        for report in run_batch(config, args.source, args.output, args.processes):
+            if "error" in report:
+                failed += 1
+                print(f"{report['name']}: {report['error']}", file=sys.stderr)
+            else:
+                print(f"{report['name']}: {report['rows']} rows x {report['stitches']} stitches in {report['seconds']}s")
+        print(f"summary written to {os.path.join(os.path.expanduser(args.output), 'summary.json')}")
+        return 1 if failed else 0
+    elif args.command == "compile-tiles":
+        from TileStore import compile_tile_store
+        tile_ids = compile_tile_store(args.sjonabok, args.archive)
+        print(f"{len(tile_ids)} tiles written to {args.archive}")
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
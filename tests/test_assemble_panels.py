@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from AddBackgroundAndBorder import (add_background_seamless, assemble_panels, get_background_cutoff_row_number,
+                                    get_background_shift)
+
+
+TILE = np.array([[1, 1, 0, 0, 1, 0, 1],
+                 [0, 1, 1, 0, 0, 0, 1],
+                 [1, 0, 0, 1, 1, 0, 1],
+                 [0, 0, 1, 1, 0, 1, 1],
+                 [1, 1, 1, 0, 1, 0, 0],
+                 [1, 1, 1, 1, 1, 1, 1]])
+BACKGROUND_ROWS = TILE.shape[0] - 1
+
+
+def make_panels(seed, count=5, stitches=24):
+    rng = np.random.default_rng(seed)
+    panels = []
+    for rows in rng.integers(1, 30, count):
+        panel = np.ones((rows, stitches), dtype=np.uint8)
+        motif = rng.random((rows, stitches)) < 0.2
+        motif[:, [0, -1]] = False
+        panel[motif] = rng.integers(2, 5, motif.sum())
+        panels.append(panel)
+    return panels
+
+
+def serial(panels, **options):
+    """
+    The panels filled one after the other with the chained cutoff, as before assemble_panels.
+    """
+    cutoff = 0
+    filled = []
+    for panel in panels:
+        rows = panel.shape[0]
+        shift = get_background_shift(rows, BACKGROUND_ROWS, cutoff)
+        cutoff = get_background_cutoff_row_number(rows, BACKGROUND_ROWS, cutoff)
+        filled.append(np.asarray(add_background_seamless(panel.copy(), TILE, shift_background=shift, **options)))
+    return filled
+
+
+@pytest.mark.parametrize("processes", [None, 1, 2])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_assemble_panels_equals_serial(processes, seed):
+    panels = make_panels(seed)
+    originals = [panel.copy() for panel in panels]
+    expected = serial(panels, border_color=3)
+
+    filled = assemble_panels(panels, TILE, processes=processes, border_color=3)
+    assert len(filled) == len(expected)
+    for result, panel in zip(filled, expected):
+        assert np.array_equal(np.asarray(result), panel)
+
+    stacked = assemble_panels(panels, TILE, processes=processes, concatenate=True, border_color=3)
+    assert np.array_equal(np.asarray(stacked), np.vstack(expected[::-1]))
+    for panel, original in zip(panels, originals):
+        assert np.array_equal(panel, original)
+
+
+@pytest.mark.parametrize("processes", [None, 1, 2])
+def test_assemble_panels_seams_are_continuous(processes):
+    panels = [np.ones((rows, 12), dtype=np.uint8) for rows in (7, 3, 11, 1, 5)]
+    stacked = np.asarray(assemble_panels(panels, TILE, processes=processes, concatenate=True, border=False))
+    assert np.array_equal(stacked[:-BACKGROUND_ROWS], stacked[BACKGROUND_ROWS:])
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ImageToPattern import imageToGray
+
+
+def photo(width, height, seed):
+    """
+    A photo like RGB image with gradients, hard edged discs and noise.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]/max(width, height)
+    gray = 128 + 60*np.sin(7*x + 3*y) + 40*np.cos(11*y*x + 2)
+    for _ in range(12):
+        cx, cy, r = rng.random(3)
+        gray[(x - cx)**2 + (y - cy*height/width)**2 < (r/6)**2] = rng.integers(0, 256)
+    gray += rng.normal(0, 12, gray.shape)
+    rgb = np.stack([gray, gray*0.9 + 20, gray*1.1 - 20], axis=-1)
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+@pytest.fixture(scope="module", params=[0, 1, 2])
+def photos(request, tmp_path_factory):
+    image = photo(3000, 2000, request.param)
+    jpeg = tmp_path_factory.mktemp("photos")/"photo.jpg"
+    png = jpeg.with_suffix(".png")
+    image.save(jpeg, quality=90)
+    image.resize((1500, 1000)).save(png)
+    return str(jpeg), str(png)
+
+
+@pytest.mark.parametrize("stitches", [40, 60, 90, 120, 180, 400])
+def test_reduced_decode_is_close_to_full_decode(photos, stitches):
+    jpeg, png = photos
+    reduced = imageToGray(jpeg, stitches).astype(int)
+    full = imageToGray(jpeg, stitches, reducing_gap=None).astype(int)
+    assert reduced.shape == full.shape
+    assert np.abs(reduced - full).max() <= 2
+
+    reduced = imageToGray(png, stitches)
+    full = imageToGray(png, stitches, reducing_gap=None)
+    assert np.array_equal(reduced, full)
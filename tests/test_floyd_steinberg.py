@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from ImageToPattern import findNearestColor, floydSteinberg, grayLevels
+
+
+def per_pixel(img_array, colors):
+    """
+    The pixel by pixel Floyd-Steinberg loop that floydSteinberg replaces.
+    """
+    rows, stitches = img_array.shape
+    for y in range(rows):
+        for x in range(stitches):
+            old_pixel = img_array[y, x]
+            new_pixel = findNearestColor(old_pixel, colors)
+            img_array[y, x] = new_pixel
+            quant_error = old_pixel - new_pixel
+
+            if x + 1 < stitches:
+                img_array[y, x + 1] += quant_error * 7 / 16
+            if y + 1 < rows:
+                if x - 1 >= 0:
+                    img_array[y + 1, x - 1] += quant_error * 3 / 16
+                img_array[y + 1, x] += quant_error * 5 / 16
+                if x + 1 < stitches:
+                    img_array[y + 1, x + 1] += quant_error * 1 / 16
+    return img_array
+
+
+@pytest.mark.parametrize("num_colors", [3, 4])
+@pytest.mark.parametrize("stitches", [1, 2, 3, 17, 64, 180])
+def test_floyd_steinberg_equals_per_pixel_loop(num_colors, stitches):
+    rng = np.random.default_rng(stitches*10 + num_colors)
+    colors = grayLevels(num_colors)
+    img_array = rng.integers(0, 256, (23, stitches))/255.0
+
+    expected = per_pixel(img_array.copy(), colors)
+    result = img_array.copy()
+    floydSteinberg(result, colors)
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize("num_colors", [3, 4])
+@pytest.mark.parametrize("band_rows", [1, 5, 16, 40])
+def test_floyd_steinberg_bands_equal_whole_array(num_colors, band_rows):
+    rng = np.random.default_rng(band_rows*10 + num_colors)
+    colors = grayLevels(num_colors)
+    img_array = rng.integers(0, 256, (37, 50))/255.0
+
+    whole = img_array.copy()
+    floydSteinberg(whole, colors)
+
+    bands = []
+    carry = None
+    for i in range(0, len(img_array), band_rows):
+        band = img_array[i:i + band_rows].copy()
+        carry = floydSteinberg(band, colors, carry)
+        bands.append(band)
+    assert np.array_equal(np.vstack(bands), whole)
@@ -0,0 +1,39 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from AddBackgroundAndBorder import add_background_seamless, iter_add_background
+
+
+def run_bands(bands, tile, **options):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        result = np.vstack(list(iter_add_background(bands, tile, **options)))
+    return result, bool(caught)
+
+
+def test_motif_in_bottom_corner_of_look_ahead_row():
+    M = np.ones((4, 3), dtype=np.uint8)
+    M[-1, 0] = 2
+    M[0, 1] = 3
+    tile = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 0]])
+    result, warned = run_bands([M[:2], M[2:3], M[3:]], tile, border_color=3)
+    assert np.array_equal(result, np.asarray(add_background_seamless(M.copy(), tile, border_color=3)))
+    assert not warned
+
+
+@pytest.mark.parametrize("background_starts", [None, "auto"])
+def test_bands_equal_whole_pattern_or_warn(background_starts):
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n, m = rng.integers(2, 30), rng.integers(3, 20)
+        M = np.ones((n, m), dtype=np.uint8)
+        motif = rng.random((n, m)) < rng.uniform(0.1, 0.5)
+        M[motif] = rng.integers(2, 5, motif.sum())
+        bands = np.split(M, sorted(set(rng.integers(1, n, rng.integers(0, 5)).tolist())))
+        tile = rng.integers(0, 2, (rng.integers(2, 6), rng.integers(2, 6)))
+
+        result, warned = run_bands(bands, tile, background_starts=background_starts, border_color=3)
+        whole = np.asarray(add_background_seamless(M.copy(), tile, background_starts=background_starts, border_color=3))
+        assert warned or np.array_equal(result, whole)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from PassapClient import PassapClient, sendPattern
+from ProcessPatternsForMachine import separateColors
+
+
+class StubPassAPI(ThreadingHTTPServer):
+    """
+    A passAPI stub that records the payloads it accepts. answers is a list of what to do with
+    the next requests: a status code, "drop" to read the request and close the connection without
+    answering, or "close-after" to answer 200 and then close the keep-alive connection silently.
+    When answers is empty the requests are answered with 200.
+    """
+    daemon_threads = True
+
+    def __init__(self, answers=()):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.answers = list(answers)
+        self.payloads = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/pattern"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            answer = self.server.answers.pop(0) if self.server.answers else 200
+            if answer in (200, "drop", "close-after"):
+                self.server.payloads.append(payload)
+        if answer == "drop":
+            self.close_connection = True
+            return
+        self.send_response(200 if answer == "close-after" else answer)
+        if answer == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+        if answer == "close-after":
+            self.close_connection = True
+
+
+@pytest.fixture
+def stub():
+    servers = []
+    def start(answers=()):
+        server = StubPassAPI(answers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(url, payload, **options):
+    async def send():
+        async with PassapClient(url, backoff=0, **options) as client:
+            await client.post(payload)
+            return client.requests
+    return asyncio.run(send())
+
+
+def test_stream_sends_lines_in_order_over_one_connection(stub):
+    server = stub()
+    A = np.random.default_rng(0).integers(1, 5, (50, 30))
+    assert sendPattern(A, -10, server.url, chunk_rows=16) == len(separateColors(A))
+    assert [payload["start"] for payload in server.payloads] == [-10]*len(server.payloads)
+    assert sum((payload["pattern"] for payload in server.payloads), []) == np.asarray(separateColors(A)).tolist()
+    assert server.connections == 1
+
+
+def test_refused_connection_is_retried_then_fails():
+    with socket.socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+    with pytest.raises(ConnectionError, match="3 tries"):
+        post(f"http://127.0.0.1:{port}/", {"start": 0, "pattern": []}, retries=2)
+
+
+def test_429_is_retried(stub):
+    server = stub([429, 429])
+    assert post(server.url, {"start": 0, "pattern": [[1]]}) == 3
+    assert len(server.payloads) == 1
+
+
+@pytest.mark.parametrize("answer", [500, 503])
+def test_5xx_is_not_sent_again(stub, answer):
+    server = stub([answer])
+    with pytest.raises(ConnectionError, match=str(answer)):
+        post(server.url, {"start": 0, "pattern": [[1]]})
+    assert server.answers == []
+
+
+def test_dropped_connection_after_sending_is_not_sent_again(stub):
+    server = stub(["drop"])
+    with pytest.raises(ConnectionError, match="not sent again"):
+        post(server.url, {"start": 0, "pattern": [[1]]})
+    assert len(server.payloads) == 1
+
+
+def test_closed_idle_connection_is_retried(stub):
+    server = stub(["close-after"])
+    A = np.random.default_rng(1).integers(1, 5, (10, 20))
+    sendPattern(A, 0, server.url, chunk_rows=8, backoff=0)
+    assert sum((payload["pattern"] for payload in server.payloads), []) == np.asarray(separateColors(A)).tolist()
+    assert server.connections == 2